@@ -1,6 +1,26 @@
+import os
+import sys
+
 import numpy as np
 from scipy.stats import norm
 
+# Runnable as a script too: put the package root (library) on the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.barrier_analytic import barrier_option_analytic
+from Derivatives.correlation import DiagonalPlusLowRank
+from Derivatives.mc_engine import (RealizedCorrelation, correlate, correlation_factor, gbm_at_dates, gbm_barrier_hit,
+                                   gbm_bridge_survival, gbm_extrema, gbm_log_blocks, simulation_grid, time_chunk,
+                                   vasicek_at_dates, vasicek_moments)
+from Derivatives.parallel import run_blocks
+from Derivatives.random_sources import make_source
+from Derivatives.sabr import sabr_implied_vol
+from Derivatives.variance_reduction import EstimatorSet, MCEstimator
+
+# barrier_option_mc(method='auto') uses the discrete-monitoring (Broadie-Glasserman-Kou) closed form
+# only when sqrt(T / steps), in sqrt(years), is at most this: roughly 100 or more monitoring dates a year.
+# On coarser grids the correction is off by several percent (see the benchmark in __main__).
+BGK_MAX_SQRT_DT = 0.1
+
 
 # Futures and Forwards Pricing
 def future_price(S0, r, T, dividends=0):
@@ -34,129 +54,548 @@ def black_scholes_put(S0, K, r, sigma, T, q=0):
     return K * np.exp(-r * T) * norm.cdf(-d2) - S0 * np.exp(-q * T) * norm.cdf(-d1)
 
 
-# Barrier Option Pricing (Monte Carlo for Down-and-Out Call)
+# Barrier Option Pricing (Monte Carlo, streamed in constant memory)
 def barrier_option_mc(S0, K, r, sigma, T, barrier, n_paths=10000, steps=252, option_type='call',
-                      barrier_type='down_out'):
+                      barrier_type='down_out', seed=None, chunk_size=None, rebate=0, method='auto',
+                      monitoring='discrete', antithetic=False, moment_matching=False, control_variate=False,
+                      sampler='pseudo', workers=None):
     """
     Price a barrier option using Monte Carlo simulation.
-    barrier_type: 'down_out', 'up_out', etc. (simplified to down-and-out)
+    barrier_type: 'down_out', 'down_in', 'up_out' or 'up_in'
+    monitoring: 'discrete' checks the barrier at each of the steps; 'continuous' weights each
+    path by its exact Brownian-bridge survival probability between grid points, so a coarse
+    grid (e.g. monthly steps) prices a continuously monitored barrier without grid bias
+    seed: int or None; results are reproducible bit-for-bit for a given seed
+    chunk_size: maximum number of normals held in memory at once (None = one block of
+    BLOCK_PATHS paths); peak memory does not grow with n_paths
+    rebate: cash rebate, paid at the hit for knock-outs, at expiry for knock-ins. With continuous
+    monitoring the simulated hit time is the middle of the step the bridge crosses in
+    method: 'auto', 'analytic' or 'mc'. 'auto' uses the closed form for continuous monitoring.
+    For discrete monitoring it uses the closed form with the monitoring correction only where
+    that correction is reliable, and simulates the paths when
+    - the grid is coarse: sqrt(T / steps) > BGK_MAX_SQRT_DT (daily monitoring stays analytic),
+    - the payoff is in the money at the barrier (e.g. an up-and-out call with the barrier above
+      the strike) and the barrier is within one terminal standard deviation of the strike, or
+    - the spot is within one step's standard deviation of the barrier.
+    antithetic, moment_matching: variance reduction on the normals
+    control_variate: use the vanilla payoff (black_scholes_call/put) and the terminal
+    forward as control variates
+    sampler: 'pseudo', 'sobol' (scrambled Sobol, Brownian-bridge ordering), 'sobol-pca'
+    or a random source object (see random_sources.make_source)
+    workers: None (serial), a number of worker processes or an Executor (see parallel.run_blocks);
+    the result does not depend on it
+    Returns: tuple of (price, standard error); the standard error is 0 for the closed form
     """
-    dt = T / steps
-    paths = S0 * np.exp(
-        np.cumsum((r - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * np.random.randn(n_paths, steps), axis=1))
+    continuous = monitoring == 'continuous'
+    if method == 'analytic' or (method == 'auto' and not _barrier_needs_simulation(S0, K, sigma, T, barrier, steps,
+                                                                                   option_type, monitoring)):
+        price = barrier_option_analytic(S0, K, r, sigma, T, barrier, option_type, barrier_type,
+                                        rebate=rebate, monitoring_steps=None if continuous else steps)
+        return float(price), 0.0
+
+    source = make_source(sampler, seed)
+    growth = np.exp(r * T)
+    if control_variate:
+        vanilla = black_scholes_call(S0, K, r, sigma, T) if option_type == 'call' \
+            else black_scholes_put(S0, K, r, sigma, T)
+        estimator = MCEstimator([vanilla * growth, S0 * growth], antithetic, source.n_replicates)
+    else:
+        estimator = MCEstimator(antithetic=antithetic, n_replicates=source.n_replicates)
+
+    run_blocks(_barrier_block, n_paths, estimator, (S0, K, r, sigma, T, barrier, steps, option_type, barrier_type,
+                                                    continuous, rebate, source, chunk_size, antithetic,
+                                                    moment_matching),
+               workers)
+    mean, std_err = estimator.result()
+    return mean / growth, std_err / growth
 
-    # Apply barrier condition (down-and-out)
-    knocked_out = np.any(paths < barrier, axis=1)
-    paths[knocked_out, -1] = 0  # Set payoff to 0 if knocked out
+
+def _barrier_needs_simulation(S0, K, sigma, T, barrier, steps, option_type, monitoring):
+    """
+    Whether barrier_option_mc(method='auto') simulates the paths instead of using the closed form.
+    """
+    if monitoring == 'continuous':
+        return False
+    coarse_grid = np.sqrt(T / steps) > BGK_MAX_SQRT_DT
+    phi = 1.0 if option_type == 'call' else -1.0
+    in_the_money_at_barrier = phi * (barrier - K) > 0 and abs(np.log(barrier / K)) < sigma * np.sqrt(T)
+    near_barrier = abs(np.log(S0 / barrier)) < sigma * np.sqrt(T / steps)
+    return bool(coarse_grid or in_the_money_at_barrier or near_barrier)
+
+
+def _barrier_block(block, n_block, S0, K, r, sigma, T, barrier, steps, option_type, barrier_type, continuous,
+                   rebate, source, chunk_size, antithetic, moment_matching):
+    """
+    Undiscounted barrier payoffs (rebate included, valued at T) and controls (vanilla payoff, S_T)
+    for one path block.
+    """
+    direction, knock = barrier_type.split('_')
+    vr = dict(antithetic=antithetic, moment_matching=moment_matching, blocks=[(block, n_block)])
+    hit_growth = None
+    if rebate != 0 and knock == 'out':
+        S_T, survival, hit_growth = next(gbm_barrier_hit(S0, r, sigma, T, n_block, steps, barrier, direction == 'down',
+                                                         continuous, source, chunk_size, **vr))
+    elif continuous:
+        S_T, survival = next(gbm_bridge_survival(S0, r, sigma, T, n_block, steps, barrier, direction == 'down',
+                                                 source, chunk_size, **vr))
+    else:
+        S_T, S_min, S_max = next(gbm_extrema(S0, r, sigma, T, n_block, steps, source, chunk_size, **vr))
+        survival = ~(S_min < barrier if direction == 'down' else S_max > barrier)
+    alive = survival if knock == 'out' else 1 - survival
 
     if option_type == 'call':
-        payoffs = np.maximum(paths[:, -1] - K, 0)
+        payoffs = np.maximum(S_T - K, 0)
     else:
-        payoffs = np.maximum(K - paths[:, -1], 0)
+        payoffs = np.maximum(K - S_T, 0)
+    value = payoffs * alive
+    if rebate != 0:  # knock-outs pay at the hit (grown to T), knock-ins at expiry if never knocked in
+        value = value + rebate * (hit_growth if knock == 'out' else survival)
+    return value, [payoffs, S_T]
 
-    price = np.exp(-r * T) * np.mean(payoffs)
-    return price
 
+# Barrier Option Greeks (pathwise / likelihood ratio, same paths as the price)
+def barrier_option_greeks_mc(S0, K, r, sigma, T, barrier, n_paths=10000, steps=252, option_type='call',
+                             barrier_type='down_out', seed=None, chunk_size=None, monitoring='discrete',
+                             antithetic=False, control_variate=False, sampler='pseudo', workers=None):
+    """
+    Monte Carlo price, delta, vega and rho of a barrier option from one simulation.
+    monitoring='continuous' weights the paths with their Brownian-bridge survival probability,
+    which is continuous in the inputs, so the Greeks are pathwise derivatives of the weighted
+    payoff. With 'discrete' monitoring the knock indicator is not differentiable and the Greeks
+    are likelihood-ratio estimates (payoff times the score of the GBM increments).
+    Other arguments as for barrier_option_mc (the paths are the same for a given seed).
+    Returns: dict of 'price', 'delta', 'vega', 'rho' -> (estimate, standard error)
+    """
+    source = make_source(sampler, seed)
+    growth = np.exp(r * T)
+    names = ('price', 'delta', 'vega', 'rho')
+    if control_variate:
+        vanilla = black_scholes_call(S0, K, r, sigma, T) if option_type == 'call' \
+            else black_scholes_put(S0, K, r, sigma, T)
+        estimator = EstimatorSet(names, [vanilla * growth, S0 * growth], antithetic, source.n_replicates)
+    else:
+        estimator = EstimatorSet(names, antithetic=antithetic, n_replicates=source.n_replicates)
 
-# Autocallable Note Pricing (Monte Carlo)
-def autocallable_mc(S0, coupon, barrier_autocall, barrier_coupon, r, sigma, T, n_coupons, n_paths=10000,
-                    steps_per_coupon=252):
+    run_blocks(_barrier_greeks_block, n_paths, estimator,
+               (S0, K, r, sigma, T, barrier, steps, option_type, barrier_type, monitoring == 'continuous', source,
+                chunk_size, antithetic), workers)
+    return {name: (mean / growth, std_err / growth) for name, (mean, std_err) in estimator.result().items()}
+
+
+def _carry_sum(carry, terms):
     """
-    Price an autocallable note using Monte Carlo.
-    Simplified: annual coupons, autocall if above barrier_autocall.
+    carry + sum of terms over the time axis, summed sequentially so the result does not depend on chunking.
     """
-    dt = T / (n_coupons * steps_per_coupon)
-    paths = S0 * np.exp(np.cumsum(
-        (r - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * np.random.randn(n_paths, n_coupons * steps_per_coupon),
-        axis=1))
+    terms[0] += carry
+    return np.cumsum(terms, axis=0)[-1]
 
-    payoffs = np.zeros(n_paths)
+
+def _barrier_greeks_block(block, n_block, S0, K, r, sigma, T, barrier, steps, option_type, barrier_type,
+                          continuous, source, chunk_size, antithetic):
+    """
+    Undiscounted barrier payoffs, their S0 / sigma / r derivatives (rho including the -T discount
+    term) and the controls (vanilla payoff, S_T) for one path block.
+    """
+    direction, knock = barrier_type.split('_')
+    sign = 1.0 if direction == 'down' else -1.0
+    dt = T / steps
+    mu = r - 0.5 * sigma ** 2
+    h = np.log(barrier / S0)
+    var_dt = sigma ** 2 * dt
+    log_survival = d_S0 = d_sigma = d_r = 0.0
+    x_min = x_max = None
+    done = 0
+    chunks = next(gbm_log_blocks(r, sigma, T, n_block, steps, source, chunk_size, antithetic,
+                                 blocks=[(block, n_block)]))
+    for x_start, log_path in chunks:
+        m = log_path.shape[0]
+        t = dt * np.arange(done + 1, done + m + 1)[:, None]
+        x_prev = np.concatenate([x_start[None], log_path[:-1]])
+        if continuous:
+            # pathwise: dx/dsigma = W - sigma t with W = (x - mu t) / sigma, dx/dr = t
+            dist, dist_prev = sign * (log_path - h), sign * (x_prev - h)
+            dx_sigma = (log_path - mu * t) / sigma - sigma * t
+            dx_prev_sigma = (x_prev - mu * (t - dt)) / sigma - sigma * (t - dt)
+            alive = (dist > 0) & (dist_prev > 0)
+            q = 2.0 * np.where(alive, dist * dist_prev, 0.0) / var_dt
+            hit_prob = np.exp(-q)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                terms = np.where(alive, np.log1p(-hit_prob), -np.inf)
+                ratio = np.where(alive, hit_prob / -np.expm1(-q), 0.0)  # d log(1 - exp(-q)) / dq
+            log_survival = _carry_sum(log_survival, terms)
+            d_S0 = _carry_sum(d_S0, ratio * 2.0 * sign * (dist + dist_prev) / (S0 * var_dt))
+            d_sigma = _carry_sum(d_sigma, ratio * (2.0 * sign * (dx_sigma * dist_prev + dist * dx_prev_sigma)
+                                                   / var_dt - 2.0 * q / sigma))
+            d_r = _carry_sum(d_r, ratio * 2.0 * sign * (t * dist_prev + dist * (t - dt)) / var_dt)
+        else:
+            # likelihood ratio: scores of the normal increments z
+            z = (log_path - x_prev - mu * dt) / (sigma * np.sqrt(dt))
+            if done == 0:
+                d_S0 = z[0] / (S0 * sigma * np.sqrt(dt))
+            d_sigma = _carry_sum(d_sigma, (z ** 2 - 1) / sigma - z * np.sqrt(dt))
+            d_r = _carry_sum(d_r, z * np.sqrt(dt) / sigma)
+            chunk_min, chunk_max = log_path.min(axis=0), log_path.max(axis=0)
+            x_min = chunk_min if x_min is None else np.minimum(x_min, chunk_min)
+            x_max = chunk_max if x_max is None else np.maximum(x_max, chunk_max)
+        done += m
+    x_T = log_path[-1]
+    S_T = S0 * np.exp(x_T)
+
+    if option_type == 'call':
+        payoffs, itm = np.maximum(S_T - K, 0), (S_T > K).astype(float)
+    else:
+        payoffs, itm = np.maximum(K - S_T, 0), -(S_T < K).astype(float)
+    if continuous:
+        survival = np.exp(log_survival)
+        tangents = [np.where(survival > 0, survival * d, 0.0) for d in (d_S0, d_sigma, d_r)]
+        weight = survival if knock == 'out' else 1 - survival
+        weight_tangents = tangents if knock == 'out' else [-d for d in tangents]
+        S_T_tangents = [S_T / S0, S_T * ((x_T - mu * T) / sigma - sigma * T), S_T * T]
+        delta, vega, rho = (itm * dS * weight + payoffs * dw for dS, dw in zip(S_T_tangents, weight_tangents))
+        price = payoffs * weight
+    else:
+        knocked = S0 * np.exp(x_min) < barrier if direction == 'down' else S0 * np.exp(x_max) > barrier
+        price = payoffs * (~knocked if knock == 'out' else knocked)
+        delta, vega, rho = price * d_S0, price * d_sigma, price * d_r
+    return {'price': price, 'delta': delta, 'vega': vega, 'rho': rho - T * price}, [payoffs, S_T]
+
+
+def _autocallable_payoffs(S_obs, S0, coupon, barrier_autocall, barrier_coupon):
+    """
+    Autocallable payoffs from spots on the coupon dates, S_obs of shape (n_coupons, n_paths).
+    """
+    n_coupons, n = S_obs.shape
+    payoffs = np.zeros(n)
+    alive = np.ones(n, dtype=bool)
     for i in range(1, n_coupons + 1):
-        idx = i * steps_per_coupon - 1
-        active = payoffs == 0
-        S_t = paths[active, idx]
+        S_t = S_obs[i - 1]
 
         # Autocall check
-        autocall = S_t >= barrier_autocall * S0
-        payoffs[active & autocall] = S0 + coupon * S0 * i  # Principal + accumulated coupons
+        autocall = alive & (S_t >= barrier_autocall * S0)
+        payoffs[autocall] = S0 + coupon * S0 * i  # Principal + accumulated coupons
 
         # Coupon payment if not autocalled
-        coupon_pay = (S_t >= barrier_coupon * S0) * coupon * S0
-        payoffs[active & ~autocall] += coupon_pay
+        payoffs[alive & ~autocall & (S_t >= barrier_coupon * S0)] += coupon * S0
+        alive &= ~autocall
 
     # At maturity if not autocalled
-    active = payoffs == 0
-    S_T = paths[active, -1]
-    payoffs[active] = np.maximum(S_T, 0)  # Assuming no protection
+    payoffs[alive] += np.maximum(S_obs[-1, alive], 0)  # Assuming no protection
+    return payoffs
 
-    price = np.exp(-r * T) * np.mean(payoffs)
-    return price
+
+# Autocallable Note Pricing (Monte Carlo)
+def autocallable_mc(S0, coupon, barrier_autocall, barrier_coupon, r, sigma, T, n_coupons, n_paths=10000,
+                    steps_per_coupon=None, seed=None, antithetic=False, moment_matching=False,
+                    control_variate=False, sampler='pseudo', observation_times=None, workers=None):
+    """
+    Price an autocallable note using Monte Carlo.
+    Simplified: annual coupons, autocall if above barrier_autocall.
+    observation_times: coupon / autocall dates (default: n_coupons equally spaced dates up to T)
+    steps_per_coupon: None samples the exact GBM transition between observation dates only;
+    an int also simulates that many intermediate steps per coupon period
+    control_variate: use the spot and the autocall / coupon digitals on each coupon date
+    (known forwards and Black-Scholes digital probabilities) as control variates
+    sampler: 'pseudo', 'sobol', 'sobol-pca' or a random source object
+    workers: None (serial), a number of worker processes or an Executor (see parallel.run_blocks)
+    Returns: tuple of (price, standard error)
+    """
+    if observation_times is None:
+        observation_times = T * np.arange(1, n_coupons + 1) / n_coupons
+    t_obs = np.asarray(observation_times, dtype=float)
+    times, obs_idx = simulation_grid(t_obs, steps_per_coupon)
+    growth = np.exp(r * T)
+    source = make_source(sampler, seed)
+    if control_variate:
+        digital_probs = [norm.cdf((-np.log(level) + (r - 0.5 * sigma ** 2) * t_obs) / (sigma * np.sqrt(t_obs)))
+                         for level in (barrier_autocall, barrier_coupon)]
+        estimator = MCEstimator(np.concatenate([S0 * np.exp(r * t_obs), *digital_probs]), antithetic,
+                                source.n_replicates)
+    else:
+        estimator = MCEstimator(antithetic=antithetic, n_replicates=source.n_replicates)
+
+    run_blocks(_autocallable_block, n_paths, estimator, (S0, coupon, barrier_autocall, barrier_coupon, r, sigma,
+                                                        times, obs_idx, source, antithetic, moment_matching),
+               workers)
+    mean, std_err = estimator.result()
+    return mean / growth, std_err / growth
+
+
+def _autocallable_block(block, n_block, S0, coupon, barrier_autocall, barrier_coupon, r, sigma, times, obs_idx,
+                        source, antithetic, moment_matching):
+    """
+    Undiscounted autocallable payoffs and controls (spots and digitals on the coupon dates) for one path block.
+    """
+    z = source.normals(block, (times.size, n_block), antithetic, moment_matching)
+    return _autocallable_from_normals(z, S0, coupon, barrier_autocall, barrier_coupon, r, sigma, times, obs_idx)
+
+
+def _autocallable_from_normals(z, S0, coupon, barrier_autocall, barrier_coupon, r, sigma, times, obs_idx):
+    """
+    Autocallable payoffs and controls from the normals z (n_dates, n_paths) driving the simulation dates.
+    """
+    S_obs = gbm_at_dates(S0, r, sigma, times, z)[obs_idx]
+    payoffs = _autocallable_payoffs(S_obs, S0, coupon, barrier_autocall, barrier_coupon)
+    digitals = [S_obs >= barrier_autocall * S0, S_obs >= barrier_coupon * S0]
+    return payoffs, np.concatenate([S_obs, *digitals])
+
+
+# Autocallable Greeks (likelihood ratio, same paths as the price)
+def autocallable_greeks_mc(S0, coupon, barrier_autocall, barrier_coupon, r, sigma, T, n_coupons, n_paths=10000,
+                           steps_per_coupon=None, seed=None, antithetic=False, control_variate=False,
+                           sampler='pseudo', observation_times=None, workers=None):
+    """
+    Monte Carlo price, delta, vega and rho of an autocallable note from one simulation.
+    The autocall and coupon digitals make the payoff discontinuous, so the Greeks are
+    likelihood-ratio estimates: the payoff times the score of the GBM transitions between
+    simulation dates. Contract levels (barriers, notional) stay fixed at their S0-based values.
+    Other arguments as for autocallable_mc (the paths are the same for a given seed).
+    Returns: dict of 'price', 'delta', 'vega', 'rho' -> (estimate, standard error)
+    """
+    if observation_times is None:
+        observation_times = T * np.arange(1, n_coupons + 1) / n_coupons
+    t_obs = np.asarray(observation_times, dtype=float)
+    times, obs_idx = simulation_grid(t_obs, steps_per_coupon)
+    growth = np.exp(r * T)
+    source = make_source(sampler, seed)
+    names = ('price', 'delta', 'vega', 'rho')
+    if control_variate:
+        digital_probs = [norm.cdf((-np.log(level) + (r - 0.5 * sigma ** 2) * t_obs) / (sigma * np.sqrt(t_obs)))
+                         for level in (barrier_autocall, barrier_coupon)]
+        estimator = EstimatorSet(names, np.concatenate([S0 * np.exp(r * t_obs), *digital_probs]), antithetic,
+                                 source.n_replicates)
+    else:
+        estimator = EstimatorSet(names, antithetic=antithetic, n_replicates=source.n_replicates)
+
+    run_blocks(_autocallable_greeks_block, n_paths, estimator, (S0, coupon, barrier_autocall, barrier_coupon, r,
+                                                                sigma, T, times, obs_idx, source, antithetic),
+               workers)
+    return {name: (mean / growth, std_err / growth) for name, (mean, std_err) in estimator.result().items()}
+
+
+def _autocallable_greeks_block(block, n_block, S0, coupon, barrier_autocall, barrier_coupon, r, sigma, T, times,
+                               obs_idx, source, antithetic):
+    """
+    Undiscounted autocallable payoffs, their likelihood-ratio S0 / sigma / r derivatives and the
+    controls for one path block.
+    """
+    z = source.normals(block, (times.size, n_block), antithetic)
+    payoffs, controls = _autocallable_from_normals(z, S0, coupon, barrier_autocall, barrier_coupon, r, sigma, times,
+                                                   obs_idx)
+    sqrt_dt = np.sqrt(np.diff(times, prepend=0.0))[:, None]
+    score_S0 = z[0] / (S0 * sigma * sqrt_dt[0])
+    score_sigma = np.sum((z ** 2 - 1) / sigma - z * sqrt_dt, axis=0)
+    score_r = np.sum(z * sqrt_dt, axis=0) / sigma
+    greeks = {'price': payoffs, 'delta': payoffs * score_S0, 'vega': payoffs * score_sigma,
+              'rho': payoffs * (score_r - T)}
+    return greeks, controls
 
 
 # Range Accrual Pricing (Monte Carlo for interest rate range accrual)
-def range_accrual_mc(r0, lower, upper, coupon, T, n_paths=10000, steps=252, kappa=0.1, theta=0.05, sigma_r=0.01):
+def range_accrual_mc(r0, lower, upper, coupon, T, n_paths=10000, steps=252, kappa=0.1, theta=0.05, sigma_r=0.01,
+                     seed=None, antithetic=False, moment_matching=False, control_variate=False, sampler='pseudo',
+                     workers=None):
     """
     Price a range accrual note using Monte Carlo under Vasicek model.
+    The short rate is sampled from its exact transition on the accrual dates and the payoff at T
+    is discounted with the pathwise (trapezoidal) integral of the short rate.
+    control_variate: use the path averages of the short rate and of its squared distance to the
+    middle of the range as control variates (both have known means)
+    sampler: 'pseudo', 'sobol', 'sobol-pca' or a random source object
+    workers: None (serial), a number of worker processes or an Executor (see parallel.run_blocks)
+    Returns: tuple of (price, standard error)
     """
     dt = T / steps
-    rates = np.zeros((n_paths, steps + 1))
-    rates[:, 0] = r0
+    times = dt * np.arange(1, steps + 1)
+    mid = 0.5 * (lower + upper)
+    source = make_source(sampler, seed)
+    if control_variate:
+        mean_rates, var_rates = vasicek_moments(r0, kappa, theta, sigma_r, times)
+        estimator = MCEstimator([mean_rates.mean(), np.mean(var_rates + (mean_rates - mid) ** 2)], antithetic,
+                                source.n_replicates)
+    else:
+        estimator = MCEstimator(antithetic=antithetic, n_replicates=source.n_replicates)
 
-    for t in range(1, steps + 1):
-        rates[:, t] = rates[:, t - 1] + kappa * (theta - rates[:, t - 1]) * dt + sigma_r * np.sqrt(
-            dt) * np.random.randn(n_paths)
+    run_blocks(_range_accrual_block, n_paths, estimator, (r0, lower, upper, coupon, T, kappa, theta, sigma_r,
+                                                          times, source, antithetic, moment_matching), workers)
+    return estimator.result()
 
-    in_range = (rates[:, 1:] >= lower) & (rates[:, 1:] <= upper)
-    accrual_days = np.sum(in_range, axis=1) / steps
-    payoffs = coupon * accrual_days * T
-    price = np.mean(payoffs)
-    return price
+
+def _range_accrual_block(block, n_block, r0, lower, upper, coupon, T, kappa, theta, sigma_r, times, source,
+                         antithetic, moment_matching):
+    """
+    Discounted range accrual payoffs and controls (average rate, average squared distance to mid-range)
+    for one path block.
+    """
+    dt = T / times.size
+    z = source.normals(block, (times.size, n_block), antithetic, moment_matching)
+    rates = vasicek_at_dates(r0, kappa, theta, sigma_r, times, z)
+    integral = dt * (0.5 * r0 + rates[:-1].sum(axis=0) + 0.5 * rates[-1])
+
+    in_range = (rates >= lower) & (rates <= upper)
+    accrual_days = np.sum(in_range, axis=0) / times.size
+    payoffs = np.exp(-integral) * coupon * accrual_days * T
+    mid = 0.5 * (lower + upper)
+    return payoffs, [rates.mean(axis=0), np.mean((rates - mid) ** 2, axis=0)]
+
+
+def range_accrual_analytic(r0, lower, upper, coupon, T, steps=252, kappa=0.1, theta=0.05, sigma_r=0.01):
+    """
+    Semi-analytic price of the range accrual note priced by range_accrual_mc.
+    Each accrual date contributes its in-range probability under the T-forward measure, where the
+    Vasicek short rate is Gaussian with a shifted mean; the sum is discounted with the Vasicek bond P(0, T).
+    """
+    times = T * np.arange(1, steps + 1) / steps
+    mean, var = vasicek_moments(r0, kappa, theta, sigma_r, times)
+    mean = mean - sigma_r ** 2 / kappa ** 2 * (-np.expm1(-kappa * times)
+                                               - 0.5 * (np.exp(-kappa * (T - times)) - np.exp(-kappa * (T + times))))
+    B = -np.expm1(-kappa * T) / kappa
+    bond = np.exp((theta - sigma_r ** 2 / (2 * kappa ** 2)) * (B - T) - sigma_r ** 2 * B ** 2 / (4 * kappa) - B * r0)
+    sd = np.sqrt(var)
+    in_range = norm.cdf((upper - mean) / sd) - norm.cdf((lower - mean) / sd)
+    return bond * coupon * T * in_range.mean()
 
 
 # Worst-of Put Pricing (Monte Carlo for two assets)
-def worst_of_put_mc(S0_1, S0_2, K, r, sigma1, sigma2, rho, T, n_paths=10000, steps=252):
+def worst_of_put_mc(S0_1, S0_2, K, r, sigma1, sigma2, rho, T, n_paths=10000, steps=None, seed=None,
+                    antithetic=False, moment_matching=False, control_variate=False, sampler='pseudo',
+                    observation_times=None, workers=None):
     """
     Price a worst-of put option on two assets using Monte Carlo.
     Payoff: max(K - min(S1_T/S1_0, S2_T/S2_0) * K, 0)
+    This is the two-asset case of basket_option_mc (strike 1, notional K).
+    Returns: tuple of (price, standard error)
     """
-    dt = T / steps
-    z1 = np.random.randn(n_paths, steps)
-    z2 = rho * z1 + np.sqrt(1 - rho ** 2) * np.random.randn(n_paths, steps)
+    return basket_option_mc(1.0, r, [sigma1, sigma2], [[1.0, rho], [rho, 1.0]], T, n_paths, 'worst', 'put', K,
+                            steps=steps, seed=seed, antithetic=antithetic, moment_matching=moment_matching,
+                            control_variate=control_variate, sampler=sampler, observation_times=observation_times,
+                            workers=workers)
 
-    paths1 = S0_1 * np.exp(np.cumsum((r - 0.5 * sigma1 ** 2) * dt + sigma1 * np.sqrt(dt) * z1, axis=1))
-    paths2 = S0_2 * np.exp(np.cumsum((r - 0.5 * sigma2 ** 2) * dt + sigma2 * np.sqrt(dt) * z2, axis=1))
 
-    perf1 = paths1[:, -1] / S0_1
-    perf2 = paths2[:, -1] / S0_2
-    worst_perf = np.minimum(perf1, perf2)
-    payoffs = np.maximum(K - worst_perf * K, 0)
-    price = np.exp(-r * T) * np.mean(payoffs)
-    return price
+# Basket, worst-of and best-of options (Monte Carlo for N assets)
+def basket_option_mc(strike, r, sigma, corr, T, n_paths=10000, basket='worst', option_type='put', notional=1.0,
+                     weights=None, steps=None, seed=None, antithetic=False, moment_matching=False,
+                     control_variate=False, sampler='pseudo', observation_times=None, workers=None):
+    """
+    Price an option on the performances S_i(T)/S_i(0) of N assets using Monte Carlo.
+    Payoff: notional * max(B - strike, 0) (call) or notional * max(strike - B, 0) (put), with B the
+    worst ('worst'), best ('best') or weighted average ('average') performance
+    sigma: asset volatilities (N,)
+    corr: (N, N) correlation matrix, factorized once and cached, or a structured DiagonalPlusLowRank
+    (see correlation_factor)
+    weights: basket weights for 'average' (default equal weights)
+    observation_times: simulation schedule ending at T (default: T only, the exact terminal draw)
+    steps: if given, simulate on a uniform grid of that many steps instead
+    control_variate: use the single-asset options on each performance (Black-Scholes) as controls
+    sampler: 'pseudo', 'sobol', 'sobol-pca' or a random source object
+    workers: None (serial), a number of worker processes or an Executor (see parallel.run_blocks)
+    Returns: tuple of (price, standard error)
+    """
+    sigma = np.asarray(sigma, dtype=float)
+    factor = correlation_factor(corr)
+    if steps is not None:
+        times = T * np.arange(1, steps + 1) / steps
+    else:
+        times = np.asarray([T] if observation_times is None else observation_times, dtype=float)
+    weights = np.full(sigma.size, 1.0 / sigma.size) if weights is None else np.asarray(weights, dtype=float)
+    if basket not in ('worst', 'best', 'average'):
+        raise ValueError(f"Unknown basket: {basket}")
+    growth = np.exp(r * T)
+    source = make_source(sampler, seed)
+    if control_variate:
+        vanilla = black_scholes_call if option_type == 'call' else black_scholes_put
+        means = notional * vanilla(1.0, strike, r, sigma, T) * growth
+        estimator = MCEstimator(means, antithetic, source.n_replicates)
+    else:
+        estimator = MCEstimator(antithetic=antithetic, n_replicates=source.n_replicates)
+
+    run_blocks(_basket_block, n_paths, estimator, (strike, r, sigma, factor, times, basket, option_type, notional,
+                                                   weights, source, antithetic, moment_matching), workers)
+    mean, std_err = estimator.result()
+    return mean / growth, std_err / growth
+
+
+def _basket_block(block, n_block, strike, r, sigma, factor, times, basket, option_type, notional, weights, source,
+                  antithetic, moment_matching):
+    """
+    Undiscounted basket payoffs and controls (single-asset payoffs) for one path block.
+    """
+    z = source.normals(block, (factor.shape[1], times.size, n_block), antithetic, moment_matching)
+    perf = gbm_at_dates(1.0, r, sigma, times, correlate(factor, z))[:, -1]
+    if basket == 'worst':
+        level = perf.min(axis=0)
+    elif basket == 'best':
+        level = perf.max(axis=0)
+    else:
+        level = weights @ perf
+    sign = 1.0 if option_type == 'call' else -1.0
+    return notional * np.maximum(sign * (level - strike), 0), notional * np.maximum(sign * (perf - strike), 0)
 
 
 # Correlation Swap Pricing (Monte Carlo for two assets)
-def correlation_swap_mc(S0_1, S0_2, K_cor, r, sigma1, sigma2, T, n_paths=10000, steps=252):
+def correlation_swap_mc(S0_1, S0_2, K_cor, r, sigma1, sigma2, T, n_paths=10000, steps=252, seed=None,
+                        antithetic=False, moment_matching=False, control_variate=False, sampler='pseudo',
+                        chunk_size=None, workers=None):
     """
     Price a correlation swap: pays realized correlation - K_cor
+    The two assets are simulated with correlation K_cor (the fair strike); this is the
+    two-asset case of average_correlation_swap_mc.
+    Returns: tuple of (price, standard error)
+    """
+    return average_correlation_swap_mc(K_cor, r, [sigma1, sigma2], [[1.0, K_cor], [K_cor, 1.0]], T, n_paths,
+                                       steps, None, seed, antithetic, moment_matching, control_variate, sampler,
+                                       chunk_size, workers)
+
+
+def average_correlation_swap_mc(K_cor, r, sigma, corr, T, n_paths=10000, steps=252, weights=None, seed=None,
+                                antithetic=False, moment_matching=False, control_variate=False, sampler='pseudo',
+                                chunk_size=None, workers=None):
+    """
+    Price an average-correlation (dispersion) swap on N assets: pays realized average correlation - K_cor
+    sigma: asset volatilities (N,)
+    corr: (N, N) correlation matrix of the asset returns (array or DiagonalPlusLowRank)
+    weights: None averages the N(N-1)/2 pairwise realized correlations; basket weights use the
+    index-variance definition of dispersion trading, which costs O(N) per path and step
+    control_variate: use the per-path second moments of the weighted sum of the shocks and of the
+    weighted squared shocks as controls; they linearize the realized correlation
+    sampler: 'pseudo', 'sobol', 'sobol-pca' or a random source object
+    chunk_size: maximum number of normals held in memory at once (None = one block)
+    workers: None (serial), a number of worker processes or an Executor (see parallel.run_blocks)
+    Returns: tuple of (price, standard error)
+    """
+    sigma = np.asarray(sigma, dtype=float)
+    factor = correlation_factor(corr)
+    w = np.ones(sigma.size) if weights is None else np.asarray(weights, dtype=float)
+    source = make_source(sampler, seed)
+    estimator = MCEstimator([w @ (corr @ w), np.sum(w ** 2)] if control_variate else None, antithetic,
+                            source.n_replicates)
+
+    run_blocks(_average_correlation_block, n_paths, estimator, (K_cor, r, sigma, factor, T, steps, weights, source,
+                                                                chunk_size, antithetic, moment_matching), workers)
+    mean, std_err = estimator.result()
+    return np.exp(-r * T) * mean, np.exp(-r * T) * std_err
+
+
+def _average_correlation_block(block, n_block, K_cor, r, sigma, factor, T, steps, weights, source, chunk_size,
+                               antithetic, moment_matching):
+    """
+    Undiscounted average-correlation swap payoffs and controls for one path block, streamed in time chunks.
     """
     dt = T / steps
-    z1 = np.random.randn(n_paths, steps)
-    z2 = np.random.randn(n_paths, steps)
-
-    returns1 = (r - 0.5 * sigma1 ** 2) * dt + sigma1 * np.sqrt(dt) * z1
-    returns2 = (r - 0.5 * sigma2 ** 2) * dt + sigma2 * np.sqrt(dt) * (
-                K_cor * z1 + np.sqrt(1 - K_cor ** 2) * z2)  # Implied cor K_cor for pricing?
-    # For fair strike, set K_cor=0, price is expected cor.
-    # But to price, under measure, but simplified.
-    corrs = []
-    for i in range(n_paths):
-        ret1 = returns1[i]
-        ret2 = returns2[i]
-        cor = np.corrcoef(ret1, ret2)[0, 1]
-        corrs.append(cor)
-    realized_cor = np.mean(corrs)
-    price = np.exp(-r * T) * (realized_cor - K_cor) * 100  # Notional 100 for example
-    return price
+    drift = ((r - 0.5 * sigma ** 2) * dt)[:, None, None]
+    vol = (sigma * np.sqrt(dt))[:, None, None]
+    w = np.ones(sigma.size) if weights is None else np.asarray(weights, dtype=float)
+    draw = source.time_stream(block, (factor.shape[1], steps, n_block), antithetic, moment_matching)
+    realized = RealizedCorrelation(weights)
+    k = time_chunk(factor.shape[1] * n_block, steps, chunk_size)
+    basket_squares = own_squares = 0.0
+    for start in range(0, steps, k):
+        z = draw(min(k, steps - start))
+        eps = correlate(factor, z)
+        realized.add(drift + vol * eps)
+        basket_squares = basket_squares + np.sum(np.tensordot(w, eps, axes=1) ** 2, axis=0)
+        own_squares = own_squares + np.einsum('i,imn->n', w ** 2, eps ** 2)
+    payoffs = (realized.average() - K_cor) * 100  # Notional 100 for example
+    return payoffs, [basket_squares / steps, own_squares / steps]
 
 
 # Variance Swap Pricing (Replication approximation)
@@ -180,17 +619,13 @@ def nelson_siegel(beta0, beta1, beta2, lambda_, maturities):
     return yields
 
 
-# Volatility Models (SABR example simplified)
+# Volatility Models (SABR)
 def sabr_vol(alpha, beta, rho, nu, f, K, T):
     """
-    SABR volatility model approximation for ATM.
-    Simplified.
+    SABR (Hagan et al.) Black implied volatility; inputs broadcast.
+    Thin wrapper over Derivatives.sabr.sabr_implied_vol with the arguments in model-first order.
     """
-    z = nu / alpha * (f * K) ** ((1 - beta) / 2) * np.log(f / K)
-    x = np.log((np.sqrt(1 - 2 * rho * z + z ** 2) + z - rho) / (1 - rho))
-    vol = alpha / (f * K) ** ((1 - beta) / 2) * (1 + (
-                (1 - beta) ** 2 / 24 * np.log(f / K) ** 2 + (1 - beta) ** 4 / 1920 * np.log(f / K) ** 4)) ** -1 * z / x
-    return vol
+    return sabr_implied_vol(f, K, T, alpha, beta, rho, nu)
 
 
 # Correlation Model (Simple Hierarchical)
@@ -201,15 +636,24 @@ class HierarchicalCorrelationGenerator:
         self.intra_cor = intra_cor
         self.inter_cor = inter_cor
 
-    def generate(self):
+    def generate(self, dense=False):
+        """
+        Block correlation matrix: intra_cor within each cluster, inter_cor across clusters
+        (names past the last full cluster only get inter_cor).
+        Returns a DiagonalPlusLowRank with one global and one loading per cluster, exact and
+        O(n * n_clusters) in memory; dense=True materializes the n x n array instead.
+        """
         cluster_size = self.n // self.n_clusters
-        cor_matrix = np.full((self.n, self.n), self.inter_cor)
+        loadings = np.zeros((self.n, self.n_clusters + 1))
+        loadings[:, 0] = 1.0
         for i in range(self.n_clusters):
             start = i * cluster_size
             end = min(start + cluster_size, self.n)
-            cor_matrix[start:end, start:end] = self.intra_cor
-        np.fill_diagonal(cor_matrix, 1.0)
-        return cor_matrix
+            loadings[start:end, i + 1] = 1.0
+        core = np.diag([self.inter_cor] + [self.intra_cor - self.inter_cor] * self.n_clusters)
+        diag = 1.0 - np.einsum('ik,k,ik->i', loadings, np.diag(core), loadings)
+        cor_matrix = DiagonalPlusLowRank(diag, loadings, core)
+        return cor_matrix.dense() if dense else cor_matrix
 
 
 # Example usage
@@ -223,5 +667,27 @@ if __name__ == "__main__":
 
     print("Forward Price:", future_price(S0, r, T))
     print("BS Call:", black_scholes_call(S0, K, r, sigma, T))
-    print("Barrier Call:", barrier_option_mc(S0, K, r, sigma, T, barrier=90))
+    print("Barrier Call (price, std err):", barrier_option_mc(S0, K, r, sigma, T, barrier=90))
+
+    # Accuracy of the discrete-monitoring closed form against simulation, and what method='auto' picks
+    print("\nDiscrete barrier: closed form vs 400k-path MC (control variates)")
+    for barrier_type, option_type, barrier, steps in (('up_out', 'call', 110, 12), ('up_out', 'call', 120, 52),
+                                                       ('up_out', 'call', 110, 252), ('up_out', 'call', 130, 252),
+                                                       ('down_out', 'call', 90, 252)):
+        args = dict(steps=steps, option_type=option_type, barrier_type=barrier_type)
+        closed, _ = barrier_option_mc(S0, K, r, sigma, T, barrier, method='analytic', **args)
+        mc, se = barrier_option_mc(S0, K, r, sigma, T, barrier, n_paths=400_000, seed=1, method='mc',
+                                   control_variate=True, **args)
+        auto = 'mc' if _barrier_needs_simulation(S0, K, sigma, T, barrier, steps, option_type, 'discrete') \
+            else 'analytic'
+        print(f"{barrier_type} {option_type} H={barrier} steps={steps:>3}: closed form {closed:.4f} vs MC "
+              f"{mc:.4f}+-{se:.4f} ({(closed - mc) / se:+.1f} se), auto -> {auto}")
+
+    # Rebates in simulation against the closed form
+    for barrier_type, monitoring in (('down_out', 'continuous'), ('down_in', 'continuous'), ('down_out', 'discrete')):
+        args = dict(barrier_type=barrier_type, rebate=3, monitoring=monitoring)
+        closed, _ = barrier_option_mc(S0, K, r, sigma, T, 90, method='analytic', **args)
+        mc, se = barrier_option_mc(S0, K, r, sigma, T, 90, n_paths=400_000, seed=1, method='mc', control_variate=True,
+                                   **args)
+        print(f"{barrier_type} call H=90 rebate 3, {monitoring}: closed form {closed:.4f} vs MC {mc:.4f}+-{se:.4f}")
     # Add more examples as needed
\ No newline at end of file
@@ -0,0 +1,132 @@
+import numpy as np
+
+
+class DiagonalPlusLowRank:
+    """
+    Symmetric matrix in factor form C = diag(d) + U S U^T with loadings U (n, k), k << n.
+    Products, sampling, determinant and inverse cost O(n k^2) time and O(n k) memory;
+    dense() materializes the n x n matrix only when it is really needed.
+    """
+
+    def __init__(self, diag, loadings, core=None):
+        """
+        diag: diagonal part d (n,)
+        loadings: factor loadings U (n, k)
+        core: symmetric factor covariance S (k, k) (default identity)
+        """
+        self.diag = np.array(diag, dtype=float)
+        self.loadings = np.array(loadings, dtype=float).reshape(self.diag.size, -1)
+        k = self.loadings.shape[1]
+        self.core = np.eye(k) if core is None else np.array(core, dtype=float).reshape(k, k)
+        for array in (self.diag, self.loadings, self.core):
+            array.setflags(write=False)
+        self._factor = None
+
+    @property
+    def shape(self):
+        return self.diag.size, self.diag.size
+
+    def __matmul__(self, x):
+        """
+        Matrix product C @ x for x of shape (n,) or (n, m), without forming C.
+        """
+        x = np.asarray(x, dtype=float)
+        d = self.diag if x.ndim == 1 else self.diag[:, None]
+        return d * x + self.loadings @ (self.core @ (self.loadings.T @ x))
+
+    def dense(self):
+        """
+        The n x n matrix as a dense array (O(n^2) memory).
+        """
+        matrix = self.loadings @ self.core @ self.loadings.T
+        matrix[np.diag_indices_from(matrix)] += self.diag
+        return matrix
+
+    def __array__(self, dtype=None, copy=None):
+        return self.dense() if dtype is None else self.dense().astype(dtype)
+
+    def _capacitance(self):
+        """
+        k x k matrix I + S U^T D^-1 U of the determinant lemma and the Woodbury identity.
+        """
+        scaled = self.loadings / self.diag[:, None]
+        return np.eye(self.core.shape[0]) + self.core @ (self.loadings.T @ scaled)
+
+    def logdet(self):
+        """
+        log det C = sum log d + log det(I + S U^T D^-1 U) (C positive definite).
+        """
+        return np.sum(np.log(self.diag)) + np.linalg.slogdet(self._capacitance())[1]
+
+    def det(self):
+        return np.exp(self.logdet())
+
+    def solve(self, b):
+        """
+        C^-1 b by the Woodbury identity, for b of shape (n,) or (n, m).
+        """
+        b = np.asarray(b, dtype=float)
+        d = self.diag if b.ndim == 1 else self.diag[:, None]
+        y = b / d
+        correction = np.linalg.solve(self._capacitance(), self.core @ (self.loadings.T @ y))
+        return y - (self.loadings @ correction) / d
+
+    def inverse(self):
+        """
+        C^-1 in the same structured form: diag(1/d) + (D^-1 U) S' (D^-1 U)^T with
+        S' = -(I + S U^T D^-1 U)^-1 S.
+        """
+        core = -np.linalg.solve(self._capacitance(), self.core)
+        return DiagonalPlusLowRank(1.0 / self.diag, self.loadings / self.diag[:, None], 0.5 * (core + core.T))
+
+    def factor(self):
+        """
+        Sampling factor F of shape (n, k + n) with F F^T = C: F @ z maps k common and
+        n idiosyncratic standard normals to correlated normals without a Cholesky of C.
+        If the factor form itself is indefinite (e.g. a hierarchical correlation with the
+        intra-cluster correlation below the inter-cluster one) while C is positive semi-definite,
+        the factor is the dense (n, n) eigendecomposition of C instead.
+        """
+        if self._factor is None:
+            try:
+                self._factor = LowRankFactor(self.diag, self.loadings, self.core)
+            except ValueError:
+                eigenvalues, eigenvectors = np.linalg.eigh(self.dense())
+                if eigenvalues.min() < -1e-12 * max(1.0, np.abs(eigenvalues).max()):
+                    raise ValueError("Matrix is not positive semi-definite; cannot sample from it") from None
+                self._factor = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0.0))
+                self._factor.setflags(write=False)
+        return self._factor
+
+    def sample(self, n_samples, seed=None):
+        """
+        n_samples correlated standard normal vectors, shape (n, n_samples).
+        """
+        factor = self.factor()
+        return factor @ np.random.default_rng(seed).standard_normal((factor.shape[1], n_samples))
+
+    def __repr__(self):
+        return f"DiagonalPlusLowRank(n={self.diag.size}, rank={self.loadings.shape[1]})"
+
+
+class LowRankFactor:
+    """
+    Factor B z_common + sqrt(d) z_idiosyncratic of a DiagonalPlusLowRank matrix, usable wherever
+    a dense correlation factor is (see mc_engine.correlate): shape is (n, k + n) and
+    factor @ z takes the k common normals first, then the n idiosyncratic ones.
+    """
+
+    def __init__(self, diag, loadings, core):
+        eigenvalues, eigenvectors = np.linalg.eigh(core)
+        tol = 1e-12 * max(1.0, np.abs(eigenvalues).max(initial=0.0))
+        if eigenvalues.min(initial=0.0) < -tol or diag.min() < -tol:
+            raise ValueError("Matrix is not positive semi-definite in factor form; cannot sample from it")
+        self.common = loadings @ (eigenvectors * np.sqrt(np.maximum(eigenvalues, 0.0)))
+        self.idiosyncratic = np.sqrt(np.maximum(diag, 0.0))
+        self.shape = (diag.size, self.common.shape[1] + diag.size)
+
+    def __matmul__(self, z):
+        k = self.common.shape[1]
+        if z.ndim == 1:
+            return self.common @ z[:k] + self.idiosyncratic * z[k:]
+        return self.common @ z[:k] + self.idiosyncratic[:, None] * z[k:]
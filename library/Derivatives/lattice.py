@@ -0,0 +1,298 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+# Runnable as a script too: put the package root (library) on the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.bs_engine import _call_flag, black_scholes_greeks
+
+# Trades rolled back together; keeps the (levels, trades) buffers cache-sized
+LATTICE_BATCH = 128
+
+
+def _peizer_pratt(z, n):
+    """
+    Peizer-Pratt (method 2) inversion of the normal CDF onto a binomial with n (odd) steps.
+    """
+    return 0.5 + np.sign(z) * 0.5 * np.sqrt(-np.expm1(-(z / (n + 1 / 3 + 0.1 / (n + 1))) ** 2 * (n + 1 / 6)))
+
+
+def _binomial_parameters(method, S0, K, r, sigma, T, q, steps):
+    """
+    Up factor, down factor and up probability per step of a CRR or Leisen-Reimer tree.
+    """
+    dt = T / steps
+    growth = np.exp((r - q) * dt)
+    if method == 'crr':
+        u = np.exp(sigma * np.sqrt(dt))
+        d = 1 / u
+        return u, d, (growth - d) / (u - d)
+    if method == 'lr':
+        d1 = (np.log(S0 / K) + (r - q + 0.5 * sigma ** 2) * T) / (sigma * np.sqrt(T))
+        d2 = d1 - sigma * np.sqrt(T)
+        p = _peizer_pratt(d2, steps)
+        u = growth * _peizer_pratt(d1, steps) / p
+        return u, (growth - p * u) / (1 - p), p
+    raise ValueError(f"Unknown lattice method: {method}")
+
+
+def _exercise_steps(exercise, exercise_times, T, steps, n):
+    """
+    Boolean (steps + 1, n) mask of the time steps at which early exercise is allowed.
+    """
+    mask = np.zeros((steps + 1, n), dtype=bool)
+    if exercise == 'american':
+        mask[:] = True
+    elif exercise == 'bermudan':
+        idx = np.rint(np.asarray(exercise_times, dtype=float)[:, None] / T * steps).astype(int)
+        idx = np.clip(idx, 0, steps)
+        mask[idx, np.broadcast_to(np.arange(n), idx.shape)] = True
+    elif exercise != 'european':
+        raise ValueError(f"Unknown exercise style: {exercise}")
+    return mask
+
+
+def _smoothed_values(S, K, r, sigma, dt, q, phi, early):
+    """
+    One-step Black-Scholes values at the nodes S of the last step before expiry (the smoothing
+    of the BBS method), floored at intrinsic value where exercise is allowed.
+    """
+    values = black_scholes_greeks(S, K, r, sigma, dt, q, np.where(phi > 0, 'call', 'put'))['price']
+    return np.where(early, np.maximum(values, phi * (S - K)), values)
+
+
+def _funnel(steps, n_sd, mean, var):
+    """
+    Highest level |k| kept at each step j = 0..steps: n_sd standard deviations of the level
+    reached from the root after j steps plus its drift, the largest across the batch, of the
+    parity of j for binomial trees (the full tree when n_sd is None).
+    mean, var: mean and variance of the level change per step, per trade
+    """
+    j = np.arange(steps + 1)
+    if n_sd is None:
+        return j
+    return np.minimum(j, np.ceil(n_sd * np.sqrt(j * np.max(var)) + j * np.max(np.abs(mean))).astype(int))
+
+
+def _edge_values(S, K, r, tau, q, phi, early):
+    """
+    Values at the truncation edges for spots S with tau to expiry: the discounted forward
+    payoff, floored at intrinsic value where exercise is allowed. The edges lie n_sd standard
+    deviations from the spot, so they are only reached with negligible probability.
+    """
+    values = np.maximum(phi * (S * np.exp(-q * tau) - K * np.exp(-r * tau)), 0)
+    return np.where(early, np.maximum(values, phi * (S - K)), values)
+
+
+def _binomial_rollback(S0, K, r, T, q, phi, steps, method, sigma, early, smooth=False, n_sd=6):
+    """
+    Backward induction on a binomial tree for a batch of n trades, with nodes stored by
+    level k = ups - downs on axis 0 and trades on axis 1. Even and odd levels live in two
+    contiguous buffers, so each step reads one and writes the other with three in-place array
+    operations across the whole batch (plus one for early exercise).
+    The tree is truncated to the levels within n_sd standard deviations of the root
+    (see _funnel), with _edge_values just outside.
+    smooth: start from Black-Scholes values one step before expiry
+    """
+    u, d, p = _binomial_parameters(method, S0, K, r, sigma, T, q, steps)
+    dt = T / steps
+    disc = np.exp(-r * dt)
+    p_up, p_down = disc * p, disc * (1 - p)
+    m = _funnel(steps, n_sd, 2 * p - 1, 4 * p * (1 - p))
+    m -= (m - np.arange(steps + 1)) % 2  # levels of step j have the parity of j
+    M = int(m.max())
+    # spot at step j, level k: S0 (u d)^(j / 2) (u / d)^(k / 2), with u d = 1 for CRR;
+    # row r of the buffer of parity P holds the level 2 r - M - 1 + (P + M + 1) % 2
+    half_ud, half_ratio = 0.5 * np.log(u * d), 0.5 * np.log(u / d)
+    levels = [2 * np.arange(M + 2)[:, None] - M - 1 + (P + M + 1) % 2 for P in (0, 1)]
+    spots = [S0 * np.exp(half_ratio * k) for k in levels]
+    recombining = method == 'crr'
+    exercise_values = [phi * (S - K) for S in spots] if recombining else None
+    any_early, all_early = early.any(axis=1).tolist(), early.all(axis=1).tolist()
+    j = np.arange(steps)[:, None]
+    edge = (m[:-1] + 1)[:, None]  # level needed from step j + 1 when step j + 1 kept fewer
+    tau = T - (j + 1) * dt
+    lower_edge = _edge_values(S0 * np.exp(half_ud * (j + 1) - half_ratio * edge), K, r, tau, q, phi, early[1:])
+    upper_edge = _edge_values(S0 * np.exp(half_ud * (j + 1) + half_ratio * edge), K, r, tau, q, phi, early[1:])
+
+    V = [np.empty_like(spots[0]), np.empty_like(spots[1])]
+    top = steps - 1 if smooth else steps
+    S_top = spots[top % 2] * np.exp(half_ud * top)
+    if smooth:
+        V[top % 2][:] = _smoothed_values(S_top, K, r, sigma, dt, q, phi, early[top])
+    else:
+        V[top % 2][:] = np.maximum(phi * (S_top - K), 0)
+    tmp, exercise_tmp = np.empty_like(V[0]), np.empty_like(V[0])
+    growth = phi * np.exp(half_ud * np.arange(steps + 1)[:, None])  # phi (u d)^(j / 2)
+    computed = M + 1  # highest level valid at the step just rolled back
+    for j, mj in zip(range(top - 1, -1, -1), m[top - 1::-1].tolist()):
+        source, target = V[(j + 1) % 2], V[j % 2]
+        down = (M - mj) // 2  # row of level -mj - 1 in the source
+        if mj + 1 > computed:
+            source[down], source[down + mj + 1] = lower_edge[j], upper_edge[j]
+        first = (M + 1 - mj) // 2  # row of level -mj in the target
+        here, out = target[first:first + mj + 1], tmp[:mj + 1]
+        np.multiply(source[down + 1:down + mj + 2], p_up, out=out)
+        np.multiply(source[down:down + mj + 1], p_down, out=here)
+        here += out
+        if any_early[j]:
+            if recombining:
+                exercise = exercise_values[j % 2][first:first + mj + 1]
+            else:
+                exercise = exercise_tmp[:mj + 1]
+                np.multiply(spots[j % 2][first:first + mj + 1], growth[j], out=exercise)
+                exercise -= phi * K
+            np.maximum(here, exercise if all_early[j] else np.where(early[j], exercise, -np.inf), out=here)
+        computed = mj
+    return V[0][(M + 1) // 2]
+
+
+def _trinomial_rollback(S0, K, r, T, q, phi, steps, sigma, early, smooth=False, n_sd=6):
+    """
+    Backward induction on a trinomial tree (log-spacing sigma sqrt(3 dt), Hull's probabilities),
+    levels on axis 0 and trades on axis 1, alternating between two buffers. The spot of a level
+    does not depend on the step, so exercise values are computed once.
+    The tree is truncated to the levels within n_sd standard deviations of the root
+    (see _funnel), with _edge_values just outside.
+    smooth: start from Black-Scholes values one step before expiry
+    """
+    dt = T / steps
+    dx = sigma * np.sqrt(3 * dt)
+    drift = (r - q - 0.5 * sigma ** 2) * np.sqrt(dt / (12 * sigma ** 2))
+    disc = np.exp(-r * dt)
+    p_up, p_mid, p_down = disc * (1 / 6 + drift), disc * 2 / 3 * np.ones_like(drift), disc * (1 / 6 - drift)
+    m = _funnel(steps, n_sd, 2 * drift, 1 / 3 - 4 * drift ** 2)
+    M = int(m.max())
+    S = S0 * np.exp(dx * np.arange(-M - 1, M + 2)[:, None])  # row M + 1 + k holds level k
+    exercise_values = phi * (S - K)
+    any_early, all_early = early.any(axis=1).tolist(), early.all(axis=1).tolist()
+    edge = (m[:-1] + 1)[:, None] * dx
+    tau = T - dt * np.arange(1, steps + 1)[:, None]
+    lower_edge = _edge_values(S0 * np.exp(-edge), K, r, tau, q, phi, early[1:])
+    upper_edge = _edge_values(S0 * np.exp(edge), K, r, tau, q, phi, early[1:])
+
+    V = np.maximum(exercise_values, 0)
+    top = steps
+    if smooth:
+        top = steps - 1
+        V = _smoothed_values(S, K, r, sigma, dt, q, phi, early[top])
+    new = np.empty_like(V)
+    tmp = np.empty_like(V)
+    computed = M + 1
+    for j, mj in zip(range(top - 1, -1, -1), m[top - 1::-1].tolist()):
+        lo, hi = M + 1 - mj, M + 2 + mj
+        if mj + 1 > computed:
+            V[lo - 1], V[hi] = lower_edge[j], upper_edge[j]
+        here, out = new[lo:hi], tmp[lo:hi]
+        np.multiply(V[lo:hi], p_mid, out=here)
+        np.multiply(V[lo + 1:hi + 1], p_up, out=out)
+        here += out
+        np.multiply(V[lo - 1:hi - 1], p_down, out=out)
+        here += out
+        if any_early[j]:
+            exercise = exercise_values[lo:hi]
+            np.maximum(here, exercise if all_early[j] else np.where(early[j], exercise, -np.inf), out=here)
+        V, new = new, V
+        computed = mj
+    return V[M + 1]
+
+
+def _lattice(S0, K, r, sigma, T, q, phi, steps, method, exercise, exercise_times, smooth, n_sd):
+    """
+    Prices of a flat batch of trades on a lattice with the given number of steps,
+    rolled back LATTICE_BATCH trades at a time.
+    Returns: tuple of (prices, number of steps used)
+    """
+    if method == 'lr' and steps % 2 == 0:
+        steps += 1  # Leisen-Reimer trees need an odd number of steps
+    prices = np.empty(S0.size)
+    for start in range(0, S0.size, LATTICE_BATCH):
+        batch = slice(start, start + LATTICE_BATCH)
+        args = [x[batch] for x in (S0, K, r, T, q, phi)]
+        times = None if exercise_times is None else exercise_times[:, batch]
+        early = _exercise_steps(exercise, times, args[3], steps, args[0].size)
+        if method == 'trinomial':
+            prices[batch] = _trinomial_rollback(*args, steps, sigma[batch], early, smooth, n_sd)
+        else:
+            prices[batch] = _binomial_rollback(*args, steps, method, sigma[batch], early, smooth, n_sd)
+    return prices, steps
+
+
+# Vectorized lattice pricer for European, American and Bermudan options
+def lattice_price(S0, K, r, sigma, T, q=0, option_type='call', steps=1000, method='crr', exercise='american',
+                  exercise_times=None, richardson=False, n_sd=6):
+    """
+    Price a batch of options on a binomial or trinomial lattice by backward induction.
+    All inputs broadcast against each other and share the number of steps, so a whole
+    book is rolled back together: each time step is a handful of array operations across
+    LATTICE_BATCH trades, over the O(n_sd sqrt(steps)) nodes that matter.
+    S0, K, r, sigma, T, q: spot, strike, rate, volatility, maturity, dividend yield
+    option_type: 'call', 'put' or an array of those
+    steps: time steps per lattice
+    method: 'crr' (Cox-Ross-Rubinstein), 'lr' (Leisen-Reimer, odd steps, second-order
+    convergence for European options) or 'trinomial'
+    exercise: 'european', 'american' or 'bermudan'
+    exercise_times: Bermudan exercise dates in years, shape (n_dates,) or (n_dates, n_trades)
+    richardson: extrapolate from steps and steps / 2 assuming an error of order 1 / steps
+    (1 / steps^2 for European 'lr'); CRR and trinomial trees then start from Black-Scholes
+    values one step before expiry (BBSR), which removes the odd/even oscillation
+    n_sd: the lattice is truncated to the nodes within n_sd standard deviations (plus the drift)
+    of the spot, with the discounted forward payoff at the edges; None rolls back the full tree
+    Returns: array of prices with the broadcast shape of the inputs
+    """
+    S0, K, r, sigma, T, q, phi = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (S0, K, r, sigma, T, q)), _call_flag(option_type))
+    shape = S0.shape
+    flat = [x.ravel() for x in (S0, K, r, sigma, T, q, phi)]
+    if exercise_times is not None:
+        exercise_times = np.broadcast_to(np.asarray(exercise_times, dtype=float).reshape(
+            len(exercise_times), -1), (len(exercise_times), S0.size))
+
+    smooth = richardson and method != 'lr'
+    price, n = _lattice(*flat, steps, method, exercise, exercise_times, smooth, n_sd)
+    if richardson:
+        coarse, m = _lattice(*flat, steps // 2, method, exercise, exercise_times, smooth, n_sd)
+        order = 2 if method == 'lr' and exercise == 'european' else 1
+        price = (n ** order * price - m ** order * coarse) / (n ** order - m ** order)
+    return price.reshape(shape)
+
+
+# Benchmark: convergence to Black-Scholes and American put timing
+if __name__ == "__main__":
+    S0, K, r, sigma, T = 100.0, 105.0, 0.05, 0.25, 1.0
+    exact = black_scholes_greeks(S0, K, r, sigma, T, option_type='put')['price']
+    print("European put, error vs Black-Scholes")
+    labels = ('crr', 'crr+rich', 'lr', 'lr+rich', 'trinomial', 'tri+rich')
+    print(f"{'steps':>8}" + "".join(f"{label:>12}" for label in labels))
+    for steps in (50, 100, 200, 400, 800):
+        errors = [lattice_price(S0, K, r, sigma, T, option_type='put', steps=steps, method=method,
+                                exercise='european', richardson=rich) - exact
+                  for method, rich in (('crr', False), ('crr', True), ('lr', False), ('lr', True),
+                                       ('trinomial', False), ('trinomial', True))]
+        print(f"{steps:>8}" + "".join(f"{e:>12.1e}" for e in errors))
+
+    reference = lattice_price(S0, K, r, sigma, T, option_type='put', steps=20001, method='lr')
+    print(f"\nAmerican put (reference {reference:.6f}, LR 20001 steps)")
+    for method in ('crr', 'lr', 'trinomial'):
+        for rich in (False, True):
+            price = lattice_price(S0, K, r, sigma, T, option_type='put', steps=1000, method=method, richardson=rich)
+            label = method + ('+rich' if rich else '')
+            print(f"{label:>14}, 1000 steps: {price:.6f} (error {price - reference:+.1e})")
+
+    n_book = 2000
+    rng = np.random.default_rng(0)
+    book = dict(S0=rng.uniform(80, 120, n_book), K=100.0, r=0.05, sigma=rng.uniform(0.1, 0.5, n_book),
+                T=rng.uniform(0.25, 2.0, n_book), option_type='put')
+    print(f"\n{n_book} American puts, 1000 steps, in batches of {LATTICE_BATCH}")
+    for method in ('crr', 'lr', 'trinomial'):
+        start = time.perf_counter()
+        truncated = lattice_price(**book, steps=1000, method=method)
+        elapsed = time.perf_counter() - start
+        full = lattice_price(**book, steps=1000, method=method, n_sd=None)
+        print(f"{method:>10}: {elapsed / n_book * 1e3:.3f} ms per option, "
+              f"max difference to the full tree {np.abs(truncated - full).max():.1e}")
+    start = time.perf_counter()
+    lattice_price(S0, K, r, sigma, T, option_type='put', steps=1000)
+    print(f"One isolated trade: {(time.perf_counter() - start) * 1e3:.1f} ms (per-step overhead, not arithmetic)")
@@ -0,0 +1,353 @@
+import hashlib
+import os
+import sys
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+
+# Runnable as a script too: put the package root (library) on the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.random_sources import BLOCK_PATHS, make_source
+
+# Correlation factorizations kept across calls (least recently used are evicted)
+MAX_CACHED_FACTORS = 16
+_factor_cache = OrderedDict()
+
+
+def path_blocks(n_paths):
+    """
+    Yield (block index, number of paths in block) covering n_paths.
+    """
+    for block, start in enumerate(range(0, n_paths, BLOCK_PATHS)):
+        yield block, min(BLOCK_PATHS, n_paths - start)
+
+
+def time_chunk(n_block, steps, chunk_size=None):
+    """
+    Number of time steps to draw at once so a chunk holds at most chunk_size normals
+    (never less than one step per chunk).
+    """
+    if chunk_size is None:
+        return steps
+    return int(min(steps, max(1, chunk_size // n_block)))
+
+
+def simulation_grid(observation_times, steps_between=None):
+    """
+    Simulation dates for a payoff observed on observation_times.
+    steps_between: None simulates the observation dates only (exact for GBM);
+    an int adds that many equal steps per observation period
+    Returns: tuple of (simulation dates, indices of the observation dates in them)
+    """
+    observation_times = np.asarray(observation_times, dtype=float)
+    if steps_between is None:
+        return observation_times, np.arange(observation_times.size)
+    starts = np.concatenate([[0.0], observation_times[:-1]])
+    times = np.concatenate([np.linspace(a, b, steps_between + 1)[1:] for a, b in zip(starts, observation_times)])
+    return times, np.arange(1, observation_times.size + 1) * steps_between - 1
+
+
+def correlation_factor(corr):
+    """
+    Factor F with F F^T = corr, so F @ z turns independent normals into correlated ones.
+    Cholesky when corr is positive definite; otherwise the eigenvalues are floored at zero and
+    the rows rescaled to unit variance (nearest valid correlation, with a RuntimeWarning).
+    Factors are cached by matrix content, so repeated pricing on one matrix factorizes once.
+    Structured matrices (correlation.DiagonalPlusLowRank) supply their own (n, k + n) factor.
+    """
+    if hasattr(corr, 'factor'):
+        return corr.factor()
+    corr = np.ascontiguousarray(corr, dtype=float)
+    key = (corr.shape, hashlib.sha1(corr.tobytes()).hexdigest())
+    if key in _factor_cache:
+        _factor_cache.move_to_end(key)
+        return _factor_cache[key]
+    try:
+        factor = np.linalg.cholesky(corr)
+    except np.linalg.LinAlgError:
+        warnings.warn("Correlation matrix is not positive definite; using its eigenvalue-floored repair",
+                      RuntimeWarning, stacklevel=2)
+        eigenvalues, eigenvectors = np.linalg.eigh(0.5 * (corr + corr.T))
+        factor = eigenvectors * np.sqrt(np.maximum(eigenvalues, 0.0))
+        factor /= np.linalg.norm(factor, axis=1, keepdims=True)
+    factor.setflags(write=False)
+    _factor_cache[key] = factor
+    if len(_factor_cache) > MAX_CACHED_FACTORS:
+        _factor_cache.popitem(last=False)
+    return factor
+
+
+def correlate(factor, z):
+    """
+    Correlated normals factor @ z for z of shape (factor.shape[1], ..., n_paths), as one matrix multiply.
+    """
+    return (factor @ z.reshape(z.shape[0], -1)).reshape((factor.shape[0],) + z.shape[1:])
+
+
+def gbm_at_dates(S0, r, sigma, times, z):
+    """
+    Exact GBM values on arbitrary dates from standard normals z of shape (..., n_dates, n_paths).
+    S0 and sigma may be arrays over the leading (asset) axis.
+    """
+    dt = np.diff(np.asarray(times, dtype=float), prepend=0.0)[:, None]
+    S0 = np.asarray(S0, dtype=float)[..., None, None]
+    sigma = np.asarray(sigma, dtype=float)[..., None, None]
+    return S0 * np.exp(np.cumsum((r - 0.5 * sigma ** 2) * dt + sigma * np.sqrt(dt) * z, axis=-2))
+
+
+def vasicek_moments(r0, kappa, theta, sigma_r, times):
+    """
+    Mean and variance of the Vasicek short rate at the given dates (exact Gaussian law).
+    """
+    times = np.asarray(times, dtype=float)
+    decay = np.exp(-kappa * times)
+    return theta + (r0 - theta) * decay, sigma_r ** 2 * (1 - decay ** 2) / (2 * kappa)
+
+
+def vasicek_at_dates(r0, kappa, theta, sigma_r, times, z):
+    """
+    Exact Vasicek short rates on arbitrary dates from standard normals z of shape (..., n_dates, n_paths).
+    The AR(1) recursion x_i = exp(-kappa dt_i) x_{i-1} + s_i z_i of x = r - theta is solved in closed
+    form, x_i = exp(-kappa t_i) (x_0 + sum_k exp(kappa t_k) s_k z_k), so there is no loop over time.
+    """
+    times = np.asarray(times, dtype=float)
+    dt = np.diff(times, prepend=0.0)
+    step_sd = sigma_r * np.sqrt(-np.expm1(-2 * kappa * dt) / (2 * kappa))
+    shocks = np.cumsum((np.exp(kappa * times) * step_sd)[:, None] * z, axis=-2)
+    return theta + np.exp(-kappa * times)[:, None] * ((r0 - theta) + shocks)
+
+
+def _gbm_log_chunks(draw, n_block, steps, drift, vol, chunk_size):
+    """
+    Yield (x_start, log_path) per time chunk of one block: the log-price carried in
+    from the previous chunk and the (m, n) log-prices of the next m steps.
+    """
+    k = time_chunk(n_block, steps, chunk_size)
+    x = 0.0
+    done = 0
+    while done < steps:
+        m = min(k, steps - done)
+        incr = drift + vol * draw(m)
+        incr[0] += x  # carry the running log-price into the sequential sum
+        log_path = np.cumsum(incr, axis=0)
+        yield np.broadcast_to(x, log_path.shape[1:]), log_path
+        x = log_path[-1]
+        done += m
+
+
+def gbm_log_blocks(r, sigma, T, n_paths, steps, source=None, chunk_size=None, antithetic=False,
+                   moment_matching=False, blocks=None):
+    """
+    Yield, for each path block, a generator of (x_start, log_path) time chunks of
+    log(S / S0) under GBM. Pseudo-random normals are drawn time-major from one stream
+    per block and log-prices are accumulated sequentially, so every path is bit-for-bit
+    identical for any chunk_size. antithetic / moment_matching are applied per time
+    step across the paths of a block (see draw_normals).
+    source: random source (see make_source; None = unseeded pseudo-random). QMC sources
+    generate each block in full, so there chunk_size only bounds the path arrays
+    blocks: (block, n_block) pairs to simulate (default: all path blocks of n_paths)
+    """
+    source = make_source() if source is None else source
+    dt = T / steps
+    drift = (r - 0.5 * sigma ** 2) * dt
+    vol = sigma * np.sqrt(dt)
+    for block, n_block in path_blocks(n_paths) if blocks is None else blocks:
+        draw = source.time_stream(block, (steps, n_block), antithetic, moment_matching)
+        yield _gbm_log_chunks(draw, n_block, steps, drift, vol, chunk_size)
+
+
+# Streaming GBM engine: terminal value and running extrema per path block
+def gbm_extrema(S0, r, sigma, T, n_paths, steps, source=None, chunk_size=None, antithetic=False,
+                moment_matching=False, blocks=None):
+    """
+    Simulate GBM paths block by block, advancing each block in time chunks and
+    keeping only the running minimum, running maximum and terminal value.
+    Peak memory is O(max(chunk_size, BLOCK_PATHS)) floats regardless of n_paths.
+    S0, r, sigma, T: GBM parameters
+    steps: monitoring dates (the initial spot is not monitored)
+    source: random source (see make_source; None = unseeded pseudo-random)
+    chunk_size: maximum number of normals held in memory at once (None = one block)
+    antithetic, moment_matching: variance reduction on the normals (see draw_normals)
+    blocks: (block, n_block) pairs to simulate (default: all path blocks of n_paths)
+    Yields: tuple of (S_T, S_min, S_max) arrays for each block
+    """
+    for chunks in gbm_log_blocks(r, sigma, T, n_paths, steps, source, chunk_size, antithetic, moment_matching,
+                                 blocks):
+        x_min = x_max = x = None
+        for _, log_path in chunks:
+            chunk_min, chunk_max = log_path.min(axis=0), log_path.max(axis=0)
+            x_min = chunk_min if x_min is None else np.minimum(x_min, chunk_min)
+            x_max = chunk_max if x_max is None else np.maximum(x_max, chunk_max)
+            x = log_path[-1]
+        yield S0 * np.exp(x), S0 * np.exp(x_min), S0 * np.exp(x_max)
+
+
+# Streaming GBM engine with Brownian-bridge survival weights
+def gbm_bridge_survival(S0, r, sigma, T, n_paths, steps, barrier, is_down=True, source=None, chunk_size=None,
+                        antithetic=False, moment_matching=False, blocks=None):
+    """
+    Simulate GBM paths like gbm_extrema, but instead of checking the barrier only at
+    grid points, weight each path by the exact probability that the Brownian bridge
+    between consecutive grid points (starting from S0 at t=0) never touches a
+    continuously monitored barrier:
+        P(no hit on [t_i, t_i+1]) = 1 - exp(-2 (x_i - h)(x_i+1 - h) / (sigma^2 dt))
+    with h = log(barrier / S0), for both endpoints on the alive side.
+    Yields: tuple of (S_T, survival probability) arrays for each block
+    """
+    h = np.log(barrier / S0)
+    sign = 1.0 if is_down else -1.0
+    var_dt = sigma ** 2 * T / steps
+    for chunks in gbm_log_blocks(r, sigma, T, n_paths, steps, source, chunk_size, antithetic, moment_matching,
+                                 blocks):
+        log_survival = 0.0
+        for x_start, log_path in chunks:
+            dist = sign * (log_path - h)  # distance to the barrier, positive while alive
+            dist_prev = np.empty_like(dist)
+            dist_prev[0] = sign * (x_start - h)
+            dist_prev[1:] = dist[:-1]
+            alive = (dist > 0) & (dist_prev > 0)
+            hit_prob = np.exp(-2.0 * np.where(alive, dist * dist_prev, 0.0) / var_dt)
+            with np.errstate(divide='ignore'):
+                terms = np.where(alive, np.log1p(-hit_prob), -np.inf)
+            terms[0] += log_survival  # sequential sum, independent of chunking
+            log_survival = np.cumsum(terms, axis=0)[-1]
+            x = log_path[-1]
+        yield S0 * np.exp(x), np.exp(log_survival)
+
+
+# Streaming GBM engine with the value of a payment made at the first barrier hit
+def gbm_barrier_hit(S0, r, sigma, T, n_paths, steps, barrier, is_down=True, continuous=False, source=None,
+                    chunk_size=None, antithetic=False, moment_matching=False, blocks=None):
+    """
+    Simulate GBM paths like gbm_extrema and also track when the barrier is first hit, for
+    rebates paid at the hit. With discrete monitoring the hit is the first grid point beyond
+    the barrier; with continuous monitoring each step is weighted by its Brownian-bridge
+    survival probability (see gbm_bridge_survival) and the probability of a hit inside the
+    step is attributed to the step's midpoint.
+    Yields: tuple of (S_T, survival, hit_growth) arrays for each block, where survival is
+    the (probability of) no hit and hit_growth = E[exp(r (T - tau)) 1{tau <= T}] is the
+    value at T of a unit paid at the hit time tau
+    """
+    h = np.log(barrier / S0)
+    sign = 1.0 if is_down else -1.0
+    dt = T / steps
+    var_dt = sigma ** 2 * dt
+    for chunks in gbm_log_blocks(r, sigma, T, n_paths, steps, source, chunk_size, antithetic, moment_matching,
+                                 blocks):
+        survival, hit_growth = 1.0, 0.0
+        done = 0
+        for x_start, log_path in chunks:
+            m = log_path.shape[0]
+            t = dt * np.arange(done + 1, done + m + 1)[:, None]
+            dist = sign * (log_path - h)  # distance to the barrier, positive while alive
+            if continuous:
+                dist_prev = np.empty_like(dist)
+                dist_prev[0] = sign * (x_start - h)
+                dist_prev[1:] = dist[:-1]
+                alive = (dist > 0) & (dist_prev > 0)
+                q = 2.0 * np.where(alive, dist * dist_prev, 0.0) / var_dt
+                step_survival = np.where(alive, -np.expm1(-q), 0.0)
+                paid = t - 0.5 * dt
+            else:
+                step_survival = (dist >= 0).astype(float)
+                paid = t
+            survived = survival * np.cumprod(step_survival, axis=0)  # sequential, independent of chunking
+            before = np.concatenate([np.broadcast_to(survival, dist.shape[1:])[None], survived[:-1]])
+            terms = (before - survived) * np.exp(r * (T - paid))
+            terms[0] += hit_growth  # sequential sum, independent of chunking
+            hit_growth = np.cumsum(terms, axis=0)[-1]
+            survival = survived[-1]
+            x = log_path[-1]
+            done += m
+        yield S0 * np.exp(x), survival, hit_growth
+
+
+# Streaming realized correlation across all paths of a block
+class RealizedCorrelation:
+    """
+    Per-path realized correlation of N return series, fed in time chunks of shape (N, m, n_paths).
+    Only per-path sums are kept, so memory is independent of the number of steps and
+    there is no loop over paths.
+    """
+
+    def __init__(self, weights=None):
+        """
+        weights: None keeps all cross moments (O(N^2) per path) for pairwise correlations;
+        basket weights keep only the asset and basket variances (O(N) per path) for the
+        index-variance (dispersion) average correlation
+        """
+        self.weights = None if weights is None else np.asarray(weights, dtype=float)
+        self.count = 0
+        self.sums = self.squares = self.cross = self.basket_sum = self.basket_squares = 0.0
+
+    def add(self, returns):
+        """
+        Add a chunk of returns of shape (N, m, n_paths).
+        """
+        self.count += returns.shape[1]
+        self.sums = self.sums + returns.sum(axis=1)
+        if self.weights is None and returns.shape[0] <= 4:
+            self.cross = self.cross + np.einsum('imn,jmn->ijn', returns, returns)
+        elif self.weights is None:
+            by_path = np.ascontiguousarray(returns.transpose(2, 0, 1))  # batched matmul for larger baskets
+            self.cross = self.cross + np.matmul(by_path, by_path.transpose(0, 2, 1)).transpose(1, 2, 0)
+        else:
+            basket = np.tensordot(self.weights, returns, axes=1)
+            self.squares = self.squares + np.einsum('imn,imn->in', returns, returns)
+            self.basket_sum = self.basket_sum + basket.sum(axis=0)
+            self.basket_squares = self.basket_squares + np.einsum('mn,mn->n', basket, basket)
+
+    def matrix(self):
+        """
+        Realized correlation matrices, shape (N, N, n_paths) (pairwise mode only).
+        """
+        means = self.sums / self.count
+        cov = self.cross / self.count - means[:, None] * means[None, :]
+        sd = np.sqrt(np.einsum('iin->in', cov))
+        return cov / (sd[:, None] * sd[None, :])
+
+    def average(self):
+        """
+        Average realized correlation per path: the mean of the N(N-1)/2 pairwise correlations,
+        or with weights the index-variance definition
+            (var(basket) - sum w_i^2 var_i) / ((sum w_i sd_i)^2 - sum w_i^2 var_i)
+        """
+        if self.weights is None:
+            corr = self.matrix()
+            n = corr.shape[0]
+            return (corr.sum(axis=(0, 1)) - n) / (n * (n - 1))
+        w = self.weights[:, None]
+        means = self.sums / self.count
+        var = self.squares / self.count - means ** 2
+        basket_mean = self.basket_sum / self.count
+        basket_var = self.basket_squares / self.count - basket_mean ** 2
+        own = np.sum(w ** 2 * var, axis=0)
+        return (basket_var - own) / (np.sum(w * np.sqrt(var), axis=0) ** 2 - own)
+
+
+# Benchmark: Brownian-bridge estimator on a coarse grid vs fine-grid monitoring at equal CPU time
+if __name__ == "__main__":
+    import time
+    from Derivatives.Derivs import barrier_option_mc
+    from Derivatives.barrier_analytic import barrier_option_analytic
+
+    S0, K, r, sigma, T, barrier = 100.0, 100.0, 0.05, 0.2, 1.0, 90.0
+    exact = barrier_option_analytic(S0, K, r, sigma, T, barrier, 'call', 'down_out')
+    budget = 2.0  # seconds per estimate
+    n_seeds = 5
+
+    def _run(steps, monitoring, n_paths, seed):
+        return barrier_option_mc(S0, K, r, sigma, T, barrier, n_paths=n_paths, steps=steps, seed=seed,
+                                 method='mc', monitoring=monitoring)[0]
+
+    print(f"Continuously monitored down-and-out call, exact = {exact:.5f}, {budget:.1f}s per estimate")
+    for label, steps, monitoring in [("Fine grid, 252 steps ", 252, 'discrete'),
+                                     ("Bridge,    12 steps  ", 12, 'continuous')]:
+        start = time.perf_counter()
+        _run(steps, monitoring, 50_000, seed=n_seeds)  # timing run
+        n_paths = int(50_000 * budget / (time.perf_counter() - start))
+        estimates = np.array([_run(steps, monitoring, n_paths, seed) for seed in range(n_seeds)])
+        errors = estimates - exact
+        print(f"{label}: {n_paths:>10,} paths, bias {errors.mean():+.5f}, "
+              f"RMSE {np.sqrt(np.mean(errors ** 2)):.5f}")
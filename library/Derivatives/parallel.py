@@ -0,0 +1,74 @@
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
+from itertools import repeat
+
+# Runnable as a script too: put the package root (library) on the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.mc_engine import path_blocks
+
+
+def _block_estimate(kernel, template, block, n_block, args):
+    """
+    Partial estimator holding the payoffs of one path block.
+    """
+    estimator = template.empty()
+    estimator.add(*kernel(block, n_block, *args))
+    return estimator
+
+
+def run_blocks(kernel, n_paths, estimator, args=(), workers=None):
+    """
+    Fold the path blocks of a Monte Carlo pricer into `estimator`, serially or on a pool.
+    kernel: module-level function kernel(block, n_block, *args) -> (payoffs, controls) for one
+    path block; it must draw its normals for `block` only from the random source in args
+    estimator: MCEstimator receiving the merged sums
+    workers: None (or 1) runs in this process; an int runs on a process pool of that many
+    workers; an Executor (e.g. a ThreadPoolExecutor or a long-lived process pool) is used as is
+    Every block draws from its own stream (the SeedSequence child of the run's root with the
+    block index as spawn key), and the partial sums are merged in block order, so the result is
+    bit-for-bit the same for any number of workers. No global RNG state is used.
+    Returns: estimator
+    """
+    blocks = list(path_blocks(n_paths))
+    if isinstance(workers, Executor):
+        partials = workers.map(_block_estimate, repeat(kernel), repeat(estimator.empty()),
+                               [block for block, _ in blocks], [n_block for _, n_block in blocks], repeat(args))
+        for partial in partials:
+            estimator.merge(partial)
+        return estimator
+    if workers is None or workers <= 1 or len(blocks) == 1:
+        for block, n_block in blocks:
+            estimator.merge(_block_estimate(kernel, estimator, block, n_block, args))
+        return estimator
+    with ProcessPoolExecutor(min(workers, len(blocks))) as pool:
+        return run_blocks(kernel, n_paths, estimator, args, pool)
+
+
+# Benchmark: scaling of the Monte Carlo pricers with the number of worker processes
+if __name__ == "__main__":
+    import os
+    import time
+    from Derivatives.Derivs import autocallable_mc, barrier_option_mc, basket_option_mc
+
+    n_paths = 400_000
+    pricers = {
+        'barrier_option_mc': lambda w: barrier_option_mc(100, 100, 0.05, 0.2, 1.0, 90, n_paths=n_paths, seed=1,
+                                                         method='mc', workers=w),
+        'autocallable_mc': lambda w: autocallable_mc(100, 0.05, 1.0, 0.8, 0.03, 0.2, 3.0, 3, n_paths=n_paths,
+                                                     steps_per_coupon=84, seed=1, workers=w),
+        'basket_option_mc': lambda w: basket_option_mc(1.0, 0.03, [0.2] * 10, [[1.0 if i == j else 0.5
+                                                                                  for j in range(10)]
+                                                                                 for i in range(10)], 1.0,
+                                                       n_paths=n_paths, steps=52, seed=1, workers=w),
+    }
+    counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    print(f"{'pricer':<20}" + "".join(f"{w:>10} wk" for w in counts) + "   identical")
+    for name, price in pricers.items():
+        times, results = [], []
+        for w in counts:
+            start = time.perf_counter()
+            results.append(price(w))
+            times.append(time.perf_counter() - start)
+        same = all(result == results[0] for result in results)
+        print(f"{name:<20}" + "".join(f"{t:>12.2f}s" for t in times) + f"   {same}")
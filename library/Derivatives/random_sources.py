@@ -0,0 +1,216 @@
+import os
+import sys
+import warnings
+
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+# Runnable as a script too: put the package root (library) on the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.variance_reduction import draw_normals, match_moments
+
+# Paths per random-number block. The stream layout depends only on this constant,
+# so results for a given seed do not depend on how the work is chunked.
+BLOCK_PATHS = 8192
+
+
+def seed_sequence(seed=None):
+    """
+    Root SeedSequence for a simulation. seed=None draws fresh OS entropy once,
+    so all blocks of one run still come from a single consistent root.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def block_rng(root, block):
+    """
+    Independent Generator for stream `block` (a path block or a QMC replicate) of `root`.
+    """
+    child = np.random.SeedSequence(entropy=root.entropy, spawn_key=root.spawn_key + (block,))
+    return np.random.Generator(np.random.PCG64(child))
+
+
+class PseudoRandomSource:
+    """
+    Pseudo-random normals from an independent PCG64 stream per path block.
+    """
+    n_replicates = 1
+
+    def __init__(self, seed=None):
+        """
+        seed: int, SeedSequence or None
+        """
+        self.root = seed_sequence(seed)
+
+    def normals(self, block, shape, antithetic=False, moment_matching=False):
+        """
+        Standard normals of shape (..., steps, n_paths) for path block `block`.
+        """
+        return draw_normals(block_rng(self.root, block), shape, antithetic, moment_matching)
+
+    def time_stream(self, block, shape, antithetic=False, moment_matching=False):
+        """
+        Draw function returning the (..., steps, n_paths) normals of a block in successive
+        time chunks of m steps. The stream is drawn time-major, so the concatenated
+        chunks are identical for any chunking.
+        """
+        rng = block_rng(self.root, block)
+        *factors, _, n = shape
+        return lambda m: np.moveaxis(draw_normals(rng, (m, *factors, n), antithetic, moment_matching), 0, -2)
+
+
+def _bridge_plan(n_steps):
+    """
+    Brownian-bridge construction order on the grid 1..n_steps (unit time steps):
+    list of (index, left, right, left weight, right weight, std), terminal point first.
+    """
+    plan = [(n_steps, 0, n_steps, 0.0, 1.0, np.sqrt(n_steps))]
+    intervals = [(0, n_steps)]
+    while intervals:
+        next_intervals = []
+        for left, right in intervals:
+            if right - left < 2:
+                continue
+            mid = (left + right) // 2
+            span = right - left
+            plan.append((mid, left, right, (right - mid) / span, (mid - left) / span,
+                         np.sqrt((mid - left) * (right - mid) / span)))
+            next_intervals += [(left, mid), (mid, right)]
+        intervals = next_intervals
+    return plan
+
+
+def brownian_bridge_increments(z):
+    """
+    Map normals ordered by importance along axis -2 to time-ordered standard normal
+    increments: the first normal fixes the terminal value, the next ones the midpoints.
+    """
+    n_steps = z.shape[-2]
+    W = np.zeros(z.shape[:-2] + (n_steps + 1, z.shape[-1]))
+    for k, (idx, left, right, w_left, w_right, std) in enumerate(_bridge_plan(n_steps)):
+        W[..., idx, :] = w_left * W[..., left, :] + w_right * W[..., right, :] + std * z[..., k, :]
+    return np.diff(W, axis=-2)
+
+
+def pca_increments(z):
+    """
+    Map normals ordered by importance along axis -2 to time-ordered standard normal
+    increments through the principal components of Brownian motion on the grid.
+    """
+    n_steps = z.shape[-2]
+    grid = np.arange(1, n_steps + 1)
+    eigvals, eigvecs = np.linalg.eigh(np.minimum.outer(grid, grid).astype(float))
+    order = np.argsort(eigvals)[::-1]
+    loadings = eigvecs[:, order] * np.sqrt(np.maximum(eigvals[order], 0.0))
+    W = np.einsum('ij,...jn->...in', loadings, z)
+    return np.diff(W, axis=-2, prepend=0.0)
+
+
+class SobolSource:
+    """
+    Scrambled Sobol normals with Brownian-bridge or PCA ordering of the time dimensions.
+    Paths of every block are split evenly over n_replicates independently scrambled
+    sequences (replicate-major), so the spread of the replicate estimates gives an
+    honest standard error (see MCEstimator).
+    """
+
+    def __init__(self, seed=None, construction='bridge', n_replicates=8):
+        """
+        seed: int, SeedSequence or None (drives the scrambling)
+        construction: 'bridge', 'pca' or 'standard' (dimensions in time order)
+        n_replicates: number of independent randomizations
+        """
+        self.root = seed_sequence(seed)
+        self.construction = construction
+        self.n_replicates = n_replicates
+        self.points_per_block = -(-BLOCK_PATHS // n_replicates)
+
+    def _replicate_normals(self, replicate, start, n_points, n_steps, n_factors):
+        """
+        (n_factors, n_steps, n_points) time-ordered normals from one scrambled sequence.
+        Dimension k * n_factors + f is the k-th most important normal of factor f.
+        """
+        engine = qmc.Sobol(n_steps * n_factors, scramble=True, seed=block_rng(self.root, replicate))
+        if start:
+            engine.fast_forward(start)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)  # balance warning for non powers of two
+            u = engine.random(n_points)
+        z = ndtri(np.clip(u, 1e-16, 1 - 1e-16)).T.reshape(n_steps, n_factors, n_points).swapaxes(0, 1)
+        if self.construction == 'bridge':
+            return brownian_bridge_increments(z)
+        if self.construction == 'pca':
+            return pca_increments(z)
+        return z
+
+    def normals(self, block, shape, antithetic=False, moment_matching=False):
+        """
+        Standard normals of shape (..., steps, n_paths) for path block `block`. The path
+        count is rounded up to a multiple of n_replicates (of 2 * n_replicates if antithetic).
+        """
+        *factors, n_steps, n = shape
+        n_factors = int(np.prod(factors, dtype=int))
+        per_replicate = -(-n // self.n_replicates)
+        n_points = (per_replicate + 1) // 2 if antithetic else per_replicate
+
+        replicates = []
+        for replicate in range(self.n_replicates):
+            z = self._replicate_normals(replicate, block * self.points_per_block, n_points, n_steps, n_factors)
+            replicates.append(np.concatenate([z, -z], axis=-1) if antithetic else z)
+        z = np.concatenate(replicates, axis=-1).reshape(*factors, n_steps, -1)
+        return match_moments(z, centred=antithetic) if moment_matching else z
+
+    def time_stream(self, block, shape, antithetic=False, moment_matching=False):
+        """
+        Draw function returning the block's normals in successive time chunks. The whole
+        block is generated up front since every Sobol point spans all time dimensions.
+        """
+        z = self.normals(block, shape, antithetic, moment_matching)
+        position = [0]
+
+        def take(m):
+            start = position[0]
+            position[0] += m
+            return z[..., start:start + m, :]
+        return take
+
+
+def make_source(sampler='pseudo', seed=None):
+    """
+    Random source from a one-argument switch.
+    sampler: 'pseudo', 'sobol' (Brownian-bridge ordering), 'sobol-pca', or a source object
+    """
+    if sampler == 'pseudo':
+        return PseudoRandomSource(seed)
+    if sampler == 'sobol':
+        return SobolSource(seed, 'bridge')
+    if sampler == 'sobol-pca':
+        return SobolSource(seed, 'pca')
+    if hasattr(sampler, 'normals'):
+        return sampler
+    raise ValueError(f"Unknown sampler: {sampler}")
+
+
+# Benchmark: paths needed for a target error, pseudo-random vs Sobol, on smooth payoffs
+if __name__ == "__main__":
+    from Derivatives.Derivs import barrier_option_mc, worst_of_put_mc, range_accrual_mc
+
+    n_paths = 2 ** 15
+    pricers = {
+        'worst_of_put_mc': lambda sampler: worst_of_put_mc(100, 50, 1.0, 0.03, 0.25, 0.3, 0.6, 1.0,
+                                                           n_paths=n_paths, steps=16, seed=1, sampler=sampler),
+        'range_accrual_mc': lambda sampler: range_accrual_mc(0.03, 0.02, 0.05, 0.05, 2.0, n_paths=n_paths,
+                                                             steps=24, seed=1, sampler=sampler),
+        'barrier (bridge MC)': lambda sampler: barrier_option_mc(100, 100, 0.05, 0.2, 1.0, 90, n_paths=n_paths,
+                                                                 steps=16, seed=1, method='mc',
+                                                                 monitoring='continuous', sampler=sampler),
+    }
+    print(f"{'pricer':<22}{'sampler':<11}{'price':>10}{'std err':>12}{'path reduction':>16}")
+    for name, pricer in pricers.items():
+        _, base_se = pricer('pseudo')
+        for sampler in ('pseudo', 'sobol', 'sobol-pca'):
+            price, se = pricer(sampler)
+            print(f"{name:<22}{sampler:<11}{price:>10.5f}{se:>12.2e}{(base_se / se) ** 2:>15.1f}x")
@@ -0,0 +1,242 @@
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+# Runnable as a script too: put the package root (library) on the path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.Derivs import _autocallable_payoffs
+from Derivatives.mc_engine import correlate, correlation_factor, gbm_at_dates, path_blocks, vasicek_at_dates
+from Derivatives.random_sources import make_source
+from Derivatives.variance_reduction import MCEstimator
+
+
+def _freeze(value):
+    """
+    Hashable form of model parameters (dicts, arrays and lists become tuples).
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (np.ndarray, list, tuple)):
+        return tuple(_freeze(v) for v in np.asarray(value).tolist()) if np.ndim(value) else float(value)
+    if isinstance(value, (np.floating, np.integer)):
+        return value.item()
+    return value
+
+
+class PathSet:
+    """
+    Scenarios for one underlying (or a correlated basket) simulated once on a fixed
+    time grid and reused by any number of payoffs. Paths are stored per path block,
+    in the layout the random source produced them, so payoff estimates keep the
+    antithetic pairing and QMC replicate structure.
+    """
+
+    def __init__(self, model, params, times, n_paths, seed=None, sampler='pseudo', antithetic=False):
+        """
+        model: 'gbm' (params S0, r, sigma, optional corr; S0/sigma may be arrays for a basket)
+        or 'vasicek' (params r0, kappa, theta, sigma_r; exact transition as in range_accrual_mc)
+        times: increasing simulation dates in years (t = 0 excluded); GBM and Vasicek
+        transitions are exact, so only the dates the payoffs observe are needed
+        n_paths: number of scenarios
+        seed, sampler: random source (see random_sources.make_source)
+        antithetic: simulate antithetic pairs
+        """
+        self.model = model
+        self.params = params
+        self.times = np.asarray(times, dtype=float)
+        self.dt = np.diff(self.times, prepend=0.0)
+        self.n_paths = n_paths
+        self.antithetic = antithetic
+        source = make_source(sampler, seed)
+        self.n_replicates = source.n_replicates
+
+        if model == 'gbm':
+            S0 = np.atleast_1d(np.asarray(params['S0'], dtype=float))
+            sigma = np.broadcast_to(np.asarray(params['sigma'], dtype=float), S0.shape)
+            factor = correlation_factor(params.get('corr', np.eye(S0.size)))
+            self.blocks = []
+            for block, n_block in path_blocks(n_paths):
+                z = source.normals(block, (factor.shape[1], self.times.size, n_block), antithetic)
+                z = correlate(factor, z)
+                self.blocks.append(gbm_at_dates(S0, params['r'], sigma, self.times, z))
+        elif model == 'vasicek':
+            self.blocks = []
+            for block, n_block in path_blocks(n_paths):
+                z = source.normals(block, (self.times.size, n_block), antithetic)
+                self.blocks.append(vasicek_at_dates(params['r0'], params['kappa'], params['theta'],
+                                                    params['sigma_r'], self.times, z)[None])
+        else:
+            raise ValueError(f"Unknown model: {model}")
+        self._extrema = {}
+
+    def running_extremum(self, kind='min'):
+        """
+        Per-block running minimum ('min') or maximum ('max') along the time axis,
+        computed on first use and shared by every barrier payoff on this path set.
+        """
+        if kind not in self._extrema:
+            accumulate = np.minimum.accumulate if kind == 'min' else np.maximum.accumulate
+            self._extrema[kind] = [accumulate(block, axis=1) for block in self.blocks]
+        return self._extrema[kind]
+
+    def index(self, t):
+        """
+        Grid index of date t; the date must lie on the simulation grid.
+        """
+        i = int(np.searchsorted(self.times, t - 1e-12))
+        if i >= self.times.size or not np.isclose(self.times[i], t):
+            raise ValueError(f"Date {t} is not on the simulation grid.")
+        return i
+
+    def estimator(self, control_means=None):
+        """
+        MCEstimator matching the antithetic / replicate layout of the paths.
+        """
+        return MCEstimator(control_means, self.antithetic, self.n_replicates)
+
+    def discount(self, T):
+        """
+        Discount factor to T at the simulation rate (GBM path sets).
+        """
+        return np.exp(-self.params['r'] * T)
+
+    def __repr__(self):
+        return f"<PathSet {self.model}, {self.blocks[0].shape[0]} factor(s), {self.times.size} dates, " \
+               f"{self.n_paths} paths>"
+
+
+class ScenarioEngine:
+    """
+    Cache of path sets keyed by model, parameters, time grid, path count and seed,
+    so a book of trades on the same underlying is simulated once. Only seeded path sets
+    are cached: every unseeded request gets fresh paths.
+    """
+
+    def __init__(self, max_path_sets=16):
+        """
+        max_path_sets: number of path sets kept (least recently used are evicted)
+        """
+        self.max_path_sets = max_path_sets
+        self._cache = OrderedDict()
+
+    def path_set(self, model, params, times, n_paths, seed=None, sampler='pseudo', antithetic=False):
+        """
+        Cached PathSet for these inputs, simulating it on first use.
+        seed=None simulates new unseeded paths on every call and does not touch the cache.
+        """
+        if seed is None:
+            return PathSet(model, params, times, n_paths, seed, sampler, antithetic)
+        key = (model, _freeze(params), _freeze(times), n_paths, seed, sampler, antithetic)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        paths = PathSet(model, params, times, n_paths, seed, sampler, antithetic)
+        self._cache[key] = paths
+        if len(self._cache) > self.max_path_sets:
+            self._cache.popitem(last=False)
+        return paths
+
+
+# Payoffs evaluated on a shared PathSet; each returns (price, standard error)
+def price_barrier(paths, K, barrier, T=None, option_type='call', barrier_type='down_out', asset=0):
+    """
+    Barrier option monitored at the grid dates up to T (default: last grid date).
+    """
+    T = paths.times[-1] if T is None else T
+    i = paths.index(T)
+    direction, knock = barrier_type.split('_')
+    extrema = paths.running_extremum('min' if direction == 'down' else 'max')
+    estimator = paths.estimator()
+    for block, extremum in zip(paths.blocks, extrema):
+        S_T = block[asset, i]
+        crossed = extremum[asset, i] < barrier if direction == 'down' else extremum[asset, i] > barrier
+        alive = ~crossed if knock == 'out' else crossed
+        payoffs = np.maximum(S_T - K, 0) if option_type == 'call' else np.maximum(K - S_T, 0)
+        estimator.add(payoffs * alive)
+    mean, std_err = estimator.result()
+    return paths.discount(T) * mean, paths.discount(T) * std_err
+
+
+def price_autocallable(paths, coupon, barrier_autocall, barrier_coupon, observation_times, asset=0):
+    """
+    Autocallable note (as autocallable_mc) observed on observation_times, paid at the last one.
+    """
+    idx = [paths.index(t) for t in observation_times]
+    S0 = np.atleast_1d(paths.params['S0'])[asset]
+    estimator = paths.estimator()
+    for block in paths.blocks:
+        estimator.add(_autocallable_payoffs(block[asset, idx], S0, coupon, barrier_autocall, barrier_coupon))
+    mean, std_err = estimator.result()
+    T = observation_times[-1]
+    return paths.discount(T) * mean, paths.discount(T) * std_err
+
+
+def price_worst_of_put(paths, K, T=None):
+    """
+    Worst-of put over all assets of a basket path set (as worst_of_put_mc).
+    """
+    T = paths.times[-1] if T is None else T
+    i = paths.index(T)
+    S0 = np.atleast_1d(paths.params['S0'])
+    estimator = paths.estimator()
+    for block in paths.blocks:
+        worst_perf = np.min(block[:, i] / S0[:, None], axis=0)
+        estimator.add(np.maximum(K - worst_perf * K, 0))
+    mean, std_err = estimator.result()
+    return paths.discount(T) * mean, paths.discount(T) * std_err
+
+
+def price_range_accrual(paths, lower, upper, coupon, T=None):
+    """
+    Range accrual (as range_accrual_mc) on a Vasicek path set, accruing on grid dates up to T
+    and discounted with the trapezoidal integral of the simulated short rate.
+    """
+    T = paths.times[-1] if T is None else T
+    i = paths.index(T)
+    dt = paths.dt[:i + 1, None]
+    estimator = paths.estimator()
+    for block in paths.blocks:
+        rates = block[0, :i + 1]
+        previous = np.vstack([np.full((1, rates.shape[1]), float(paths.params['r0'])), rates[:-1]])
+        integral = np.sum(0.5 * (previous + rates) * dt, axis=0)
+        estimator.add(np.exp(-integral) * coupon * np.mean((rates >= lower) & (rates <= upper), axis=0) * T)
+    return estimator.result()
+
+
+# Example: a book of barriers and autocallables on one underlying, simulated once
+if __name__ == "__main__":
+    import time
+    from Derivatives.Derivs import autocallable_mc, barrier_option_mc
+
+    S0, r, sigma, T = 100.0, 0.03, 0.2, 2.0
+    n_paths = 20_000
+    times = np.arange(1, 505) / 252
+    rng = np.random.default_rng(0)
+    barriers = [dict(K=k, barrier=b, T=t) for k, b, t in
+                zip(rng.uniform(90, 110, 250), rng.uniform(70, 90, 250), rng.choice([0.5, 1.0, 1.5, 2.0], 250))]
+    autocalls = [dict(coupon=c, barrier_autocall=a, barrier_coupon=b) for c, a, b in
+                 zip(rng.uniform(0.02, 0.08, 250), rng.uniform(0.95, 1.1, 250), rng.uniform(0.6, 0.9, 250))]
+
+    engine = ScenarioEngine()
+    start = time.perf_counter()
+    paths = engine.path_set('gbm', dict(S0=S0, r=r, sigma=sigma), times, n_paths, seed=1)
+    t_sim = time.perf_counter() - start
+    start = time.perf_counter()
+    book = [price_barrier(paths, **trade) for trade in barriers]
+    book += [price_autocallable(paths, **trade, observation_times=[0.5, 1.0, 1.5, 2.0]) for trade in autocalls]
+    t_payoffs = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for trade in barriers[:10]:
+        barrier_option_mc(S0, trade['K'], r, sigma, trade['T'], trade['barrier'], n_paths=n_paths,
+                          steps=int(trade['T'] * 252), seed=1, method='mc')
+    for trade in autocalls[:10]:
+        autocallable_mc(S0, trade['coupon'], trade['barrier_autocall'], trade['barrier_coupon'], r, sigma, T, 4,
+                        n_paths=n_paths, seed=1)
+    t_each = (time.perf_counter() - start) / 20
+
+    print(f"Shared scenarios: {paths}")
+    print(f"  one simulation {t_sim:.2f}s + {len(book)} payoff passes {t_payoffs:.2f}s")
+    print(f"Per-trade simulation: ~{t_each * len(book):.1f}s for the same book ({t_each:.3f}s per trade)")
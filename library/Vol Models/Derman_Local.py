@@ -1,6 +1,17 @@
+import os
+import sys
+
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.interpolate import RegularGridInterpolator
+
+# Shared Monte Carlo infrastructure lives in library/Derivatives
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.implied_vol import implied_volatility
+from Derivatives.local_vol import dupire_surface
+from Derivatives.pde import dupire_forward_prices
+from Derivatives.parallel import run_blocks
+from Derivatives.random_sources import make_source
+from Derivatives.variance_reduction import MCEstimator
 
 
 class LocalVolModel:
@@ -18,81 +29,100 @@ class LocalVolModel:
         self.steps = steps
         self.dt = T / steps
 
-    def local_vol_surface(self, S, t, strikes, maturities, implied_vols):
+    def local_vol_surface(self, S, t, strikes, maturities, implied_vols, n_spots=256):
         """
-        Construct local volatility surface using Dupire's formula
+        Construct local volatility surface using Dupire's formula (see Derivatives.local_vol.DupireSurface;
+        the surface is cached per market snapshot, so repeated calls on the same data reuse it)
         S: Current stock price
         t: Current time
         strikes: Array of strike prices
         maturities: Array of maturities
         implied_vols: 2D array of implied volatilities
-        Returns: Interpolated local volatility function
+        n_spots: spot nodes of the lookup lattice between the lowest and highest strike
+        Returns: LocalVolGrid, a local_vol(S, t) function vectorized over S, tabulated once on the
+        model's time steps x n_spots spots
         """
-        # Create grid for interpolation
-        local_vols = np.zeros_like(implied_vols)
-
-        for i, T in enumerate(maturities):
-            for j, K in enumerate(strikes):
-                # Simplified Dupire formula approximation
-                sigma = implied_vols[i, j]
-                # Numerical derivatives (simplified for demonstration)
-                d1 = (np.log(S / K) + (self.r + 0.5 * sigma ** 2) * T) / (sigma * np.sqrt(T))
-                d2 = d1 - sigma * np.sqrt(T)
-
-                # Local volatility approximation
-                local_vols[i, j] = sigma * (1 + 0.1 * d1 * d2)  # Simplified adjustment
-
-        # Interpolate local volatility surface using RegularGridInterpolator
-        interp_func = RegularGridInterpolator((maturities, strikes), local_vols,
-                                              method='cubic', bounds_error=False, fill_value=None)
-
-        def local_vol(S, t):
-            if t >= max(maturities):
-                t = max(maturities) - 0.01
-            if S <= min(strikes) or S >= max(strikes):
-                S = np.clip(S, min(strikes), max(strikes))
-            return interp_func([t, S])[0]
-
-        return local_vol
-
-    def simulate_paths(self, n_paths, strikes, maturities, implied_vols, seed=None):
+        surface = dupire_surface(strikes, maturities, implied_vols, self.S0, self.r)
+        return surface.lattice(np.linspace(0, self.T, self.steps + 1), n_spots)
+
+    def simulate_paths(self, n_paths, strikes, maturities, implied_vols, seed=None, sampler='pseudo', block=0,
+                       surface=None):
         """
         Simulate asset price paths using local volatility
+        surface: prebuilt LocalVolGrid from local_vol_surface on the model's time steps (built from
+        the market data when None)
+        sampler: 'pseudo', 'sobol' (scrambled Sobol, Brownian-bridge ordering), 'sobol-pca'
+        or a random source object (see Derivatives.random_sources.make_source)
+        block: path block whose random stream is used (see Derivatives.mc_engine.path_blocks)
         Returns: Price paths
         """
-        if seed is not None:
-            np.random.seed(seed)
+        z = make_source(sampler, seed).normals(block, (self.steps, n_paths))
+        n_paths = z.shape[1]  # QMC sources round up to whole replicates
 
         S = np.zeros((self.steps + 1, n_paths))
         S[0] = self.S0
 
         # Get local volatility function
-        local_vol = self.local_vol_surface(self.S0, 0, strikes, maturities, implied_vols)
+        local_vol = surface if surface is not None else \
+            self.local_vol_surface(self.S0, 0, strikes, maturities, implied_vols)
 
         for t in range(1, self.steps + 1):
-            current_time = t * self.dt
-            # Get local volatility for each path
-            sigmas = np.array([local_vol(S[t - 1, i], current_time) for i in range(n_paths)])
+            # Local volatility of all paths from the lattice row of this step
+            sigmas = local_vol.lookup(local_vol.vols[t], S[t - 1])
             # Ensure positive volatility
             sigmas = np.maximum(sigmas, 1e-6)
             # Simulate next step
-            dW = np.random.normal(0, np.sqrt(self.dt), n_paths)
+            dW = np.sqrt(self.dt) * z[t - 1]
             S[t] = S[t - 1] * np.exp((self.r - 0.5 * sigmas ** 2) * self.dt + sigmas * dW)
 
         return S
 
-    def price_european_call(self, K, n_paths, strikes, maturities, implied_vols, seed=None):
+    def price_european_call(self, K, n_paths, strikes, maturities, implied_vols, seed=None, sampler='pseudo',
+                            workers=None):
         """
         Price European call option using Monte Carlo simulation
         K: Strike price
         n_paths: Number of simulation paths
+        sampler: 'pseudo', 'sobol', 'sobol-pca' or a random source object
+        workers: None (serial), a number of worker processes or an Executor
+        (see Derivatives.parallel.run_blocks); the result does not depend on it
         Returns: tuple of (option price, standard error)
         """
-        S = self.simulate_paths(n_paths, strikes, maturities, implied_vols, seed)
-        payoff = np.maximum(S[-1] - K, 0)
-        price = np.exp(-self.r * self.T) * np.mean(payoff)
-        std_err = np.std(payoff) / np.sqrt(n_paths)
-        return price, std_err
+        source = make_source(sampler, seed)
+        estimator = MCEstimator(n_replicates=source.n_replicates)
+        # Built once here and shipped to the blocks instead of being rebuilt in each of them
+        surface = self.local_vol_surface(self.S0, 0, strikes, maturities, implied_vols)
+        run_blocks(_call_block, n_paths, estimator, (self, K, surface, source), workers)
+        mean, std_err = estimator.result()
+        df = np.exp(-self.r * self.T)
+        return df * mean, df * std_err
+
+    def price_call_grid(self, strikes, maturities, implied_vols, grid_strikes=None, grid_maturities=None,
+                        n_space=400, n_time=200):
+        """
+        Reprice a whole grid of European calls under the Dupire local vol of the market surface with
+        one forward PDE sweep (see Derivatives.pde.dupire_forward_prices), e.g. to check the
+        calibration round trip against the input implied vols
+        strikes, maturities, implied_vols: market implied volatility surface
+        grid_strikes, grid_maturities: grid to price (the market grid when None)
+        n_space, n_time: strike intervals and time steps of the PDE
+        Returns: dict with call prices and their implied vols, both (n_maturities, n_strikes)
+        """
+        grid_strikes = np.asarray(strikes if grid_strikes is None else grid_strikes, dtype=float)
+        grid_maturities = np.asarray(maturities if grid_maturities is None else grid_maturities, dtype=float)
+        surface = dupire_surface(strikes, maturities, implied_vols, self.S0, self.r)
+        prices = dupire_forward_prices(self.S0, grid_strikes, grid_maturities, self.r, surface,
+                                       n_space=n_space, n_time=n_time)
+        vols, _ = implied_volatility(prices, self.S0, grid_strikes[None, :], self.r, grid_maturities[:, None])
+        return {'prices': prices, 'implied_vols': vols}
+
+
+def _call_block(block, n_block, model, K, surface, source):
+    """
+    Undiscounted call payoffs at maturity for one path block on the prebuilt local vol lattice.
+    """
+    S = model.simulate_paths(n_block, None, None, None, sampler=source, block=block, surface=surface)
+    return np.maximum(S[-1] - K, 0), None
 
 
 def plot_simulation(S, title="Local Volatility Model Simulation"):
@@ -134,5 +164,22 @@ if __name__ == "__main__":
     print(f"European Call Option Price: {price:.4f}")
     print(f"Standard Error: {std_err:.4f}")
 
+    # Calibration round trip on a skewed surface: the forward PDE reprices the whole grid at once
+    import time
+    from scipy.interpolate import RegularGridInterpolator
+
+    strikes, maturities = np.linspace(40, 250, 106), np.linspace(0.05, 2.0, 40)
+    skewed_vols = 0.22 - 0.1 * np.log(strikes[None, :] / S0) / np.sqrt(maturities[:, None] + 0.25) \
+        + 0.05 * np.log(strikes[None, :] / S0) ** 2
+    check_strikes, check_maturities = np.linspace(70, 140, 15), maturities[3::4]
+    start = time.perf_counter()
+    grid = model.price_call_grid(strikes, maturities, skewed_vols, check_strikes, check_maturities)
+    elapsed = time.perf_counter() - start
+    market = RegularGridInterpolator((maturities, strikes), skewed_vols)(
+        np.stack(np.meshgrid(check_maturities, check_strikes, indexing='ij'), axis=-1))
+    print(f"Forward PDE round trip on {grid['prices'].size} quotes: "
+          f"max implied vol error {np.nanmax(np.abs(grid['implied_vols'] - market)) * 1e4:.1f} bp "
+          f"({elapsed * 1e3:.0f} ms)")
+
     # Plot sample paths
     plot_simulation(S)
\ No newline at end of file
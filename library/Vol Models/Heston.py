@@ -1,5 +1,16 @@
+import os
+import sys
+
 import numpy as np
 import matplotlib.pyplot as plt
+from scipy.special import ndtr
+
+# Shared Monte Carlo infrastructure lives in library/Derivatives
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.heston_analytic import HESTON_PARAMS, calibrate_heston, heston_price_cos
+from Derivatives.parallel import run_blocks
+from Derivatives.random_sources import make_source
+from Derivatives.variance_reduction import EstimatorSet, MCEstimator
 
 
 class HestonModel:
@@ -27,13 +38,20 @@ class HestonModel:
         self.steps = steps
         self.dt = T / steps
 
-    def simulate_paths(self, n_paths, seed=None):
+    def simulate_paths(self, n_paths, seed=None, sampler='pseudo', block=0):
         """
         Simulate asset price and volatility paths using Euler discretization
+        sampler: 'pseudo', 'sobol' (scrambled Sobol, Brownian-bridge ordering), 'sobol-pca'
+        or a random source object (see Derivatives.random_sources.make_source)
+        block: path block whose random stream is used (see Derivatives.mc_engine.path_blocks)
         Returns: tuple of (price paths, volatility paths)
         """
-        if seed is not None:
-            np.random.seed(seed)
+        source = make_source(sampler, seed)
+
+        # Generate correlated Brownian motions
+        z1, z2 = source.normals(block, (2, self.steps, n_paths))
+        w2 = self.rho * z1 + np.sqrt(1 - self.rho ** 2) * z2
+        n_paths = z1.shape[1]  # QMC sources round up to whole replicates
 
         # Initialize arrays
         S = np.zeros((self.steps + 1, n_paths))
@@ -41,11 +59,6 @@ class HestonModel:
         S[0] = self.S0
         v[0] = self.v0
 
-        # Generate correlated Brownian motions
-        z1 = np.random.normal(0, 1, (self.steps, n_paths))
-        z2 = np.random.normal(0, 1, (self.steps, n_paths))
-        w2 = self.rho * z1 + np.sqrt(1 - self.rho ** 2) * z2
-
         for t in range(1, self.steps + 1):
             # Ensure variance stays positive
             v[t - 1] = np.maximum(v[t - 1], 0)
@@ -60,23 +73,194 @@ class HestonModel:
 
         return S, v
 
-    def price_european_call(self, K, n_paths=10000, seed=None):
+    def simulate_terminal_tangents(self, n_paths, seed=None, sampler='pseudo', block=0):
+        """
+        Terminal prices of the simulate_paths scheme (same normals) together with their pathwise
+        derivatives, propagated step by step alongside the Euler recursion
+        Returns: tuple of (S_T, dS_T/dS0, dS_T/dv0, dS_T/dr)
+        """
+        source = make_source(sampler, seed)
+        z1, z2 = source.normals(block, (2, self.steps, n_paths))
+        w2 = self.rho * z1 + np.sqrt(1 - self.rho ** 2) * z2
+        n_paths = z1.shape[1]
+
+        log_S = np.full(n_paths, np.log(self.S0))
+        v = np.full(n_paths, float(self.v0))
+        dlog_S = np.zeros(n_paths)  # d log S / d v0
+        dv = np.ones(n_paths)  # d v / d v0
+        sqrt_dt = np.sqrt(self.dt)
+        for t in range(self.steps):
+            v_pos = np.maximum(v, 0)
+            dv_pos = np.where(v > 0, dv, 0.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                d_sqrt_v = np.where(v > 0, dv_pos / (2 * np.sqrt(v_pos)), 0.0)
+
+            log_S += (self.r - 0.5 * v_pos) * self.dt + np.sqrt(v_pos) * sqrt_dt * z1[t]
+            dlog_S += -0.5 * dv_pos * self.dt + d_sqrt_v * sqrt_dt * z1[t]
+
+            v = v_pos + self.kappa * (self.theta - v_pos) * self.dt + self.sigma * np.sqrt(v_pos) * sqrt_dt * w2[t]
+            dv = dv_pos * (1 - self.kappa * self.dt) + self.sigma * d_sqrt_v * sqrt_dt * w2[t]
+
+        S_T = np.exp(log_S)
+        return S_T, S_T / self.S0, S_T * dlog_S, S_T * self.T
+
+    def simulate_qe(self, n_paths, seed=None, sampler='pseudo', block=0, steps=None, observation_times=None,
+                    psi_c=1.5, gamma1=0.5, gamma2=0.5, martingale_correction=True):
+        """
+        Simulate with Andersen's Quadratic-Exponential scheme, which samples the variance from a
+        moment-matched quadratic-normal or exponential-mass-at-zero law (no clipping) and stays
+        accurate with monthly or coarser steps. Normals are drawn step by step and only the
+        observed slices are kept, so memory is O(n_obs * n_paths) instead of O(steps * n_paths).
+        steps: number of equal time steps (default the model's steps); observation dates are
+        added to the grid
+        observation_times: dates to record, or None for maturity only
+        psi_c: switching threshold between the quadratic and exponential variance branches
+        gamma1, gamma2: weights of the start and end variance in the integrated variance
+        martingale_correction: adjust the log-price drift so E[S_t] = S0 exp(r t) holds exactly
+        for the discretization
+        Returns: tuple of (prices, variances), each (n_paths,) at maturity or
+        (n_obs, n_paths) at the observation dates
+        """
+        source = make_source(sampler, seed)
+        steps = self.steps if steps is None else steps
+        grid = np.linspace(0, self.T, steps + 1)[1:]
+        observed = [self.T] if observation_times is None else np.asarray(observation_times, dtype=float)
+        times = np.union1d(grid, observed)
+        record = np.isin(times, observed)
+        draw = source.time_stream(block, (2, times.size, n_paths))
+
+        kappa, theta, sigma, rho = self.kappa, self.theta, self.sigma, self.rho
+        log_S = v = None
+        S_out, v_out = [], []
+        previous = 0.0
+        for t, keep in zip(times, record):
+            dt = t - previous
+            previous = t
+            z_v, z_S = draw(1)[:, 0]
+            if log_S is None:  # QMC sources round up to whole replicates
+                log_S = np.full(z_v.size, np.log(self.S0))
+                v = np.full(z_v.size, float(self.v0))
+            decay = np.exp(-kappa * dt)
+            m = theta + (v - theta) * decay
+            s2 = v * sigma ** 2 * decay * (1 - decay) / kappa + theta * sigma ** 2 * (1 - decay) ** 2 / (2 * kappa)
+            psi = s2 / m ** 2
+            quadratic = psi <= psi_c
+            with np.errstate(divide='ignore', invalid='ignore'):
+                b2 = np.where(quadratic, 2 / psi - 1 + np.sqrt(2 / psi * (2 / psi - 1)), 0.0)
+                a = m / (1 + b2)
+                p = np.where(quadratic, 0.0, (psi - 1) / (psi + 1))
+                beta = (1 - p) / m
+                u = ndtr(z_v)
+                v_next = np.where(quadratic, a * (np.sqrt(b2) + z_v) ** 2,
+                                  np.where(u <= p, 0.0, np.log((1 - p) / (1 - u)) / beta))
+
+            k1 = gamma1 * dt * (kappa * rho / sigma - 0.5) - rho / sigma
+            k2 = gamma2 * dt * (kappa * rho / sigma - 0.5) + rho / sigma
+            k3, k4 = gamma1 * dt * (1 - rho ** 2), gamma2 * dt * (1 - rho ** 2)
+            if martingale_correction:
+                A = k2 + 0.5 * k4  # log E[exp(A v_next)] from the branch's law of v_next
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    log_mgf = np.where(quadratic, A * b2 * a / (1 - 2 * A * a) - 0.5 * np.log(1 - 2 * A * a),
+                                       np.log(p + beta * (1 - p) / (beta - A)))
+                k0 = -log_mgf - (k1 + 0.5 * k3) * v
+            else:
+                k0 = -rho * kappa * theta * dt / sigma
+            log_S += self.r * dt + k0 + k1 * v + k2 * v_next + np.sqrt(k3 * v + k4 * v_next) * z_S
+            v = v_next
+            if keep:
+                S_out.append(np.exp(log_S))
+                v_out.append(v.copy())
+
+        if observation_times is None:
+            return S_out[0], v_out[0]
+        return np.array(S_out), np.array(v_out)
+
+    def price_european_call(self, K, n_paths=10000, seed=None, sampler='pseudo', workers=None, scheme='euler',
+                            steps=None):
         """
         Price European call option using Monte Carlo simulation
         K: Strike price
         n_paths: Number of simulation paths
+        sampler: 'pseudo', 'sobol', 'sobol-pca' or a random source object
+        workers: None (serial), a number of worker processes or an Executor
+        (see Derivatives.parallel.run_blocks); the result does not depend on it
+        scheme: 'euler' (full paths on the model's daily grid) or 'qe' (Quadratic-Exponential,
+        terminal values only, see simulate_qe)
+        steps: time steps of the 'qe' scheme (default the model's steps)
         Returns: tuple of (option price, standard error)
         """
-        S, _ = self.simulate_paths(n_paths, seed)
-
-        # Calculate payoff at maturity
-        payoff = np.maximum(S[-1] - K, 0)
+        if scheme not in ('euler', 'qe'):
+            raise ValueError(f"Unknown scheme: {scheme}")
+        source = make_source(sampler, seed)
+        estimator = MCEstimator(n_replicates=source.n_replicates)
+        run_blocks(_call_block, n_paths, estimator, (self, K, source, scheme, steps), workers)
+        mean, std_err = estimator.result()
 
         # Discount back to present value
-        price = np.exp(-self.r * self.T) * np.mean(payoff)
-        std_err = np.std(payoff) / np.sqrt(n_paths)
+        df = np.exp(-self.r * self.T)
+        return df * mean, df * std_err
+
+    def price_european_cos(self, K, T=None, option_type='call', n_terms=256):
+        """
+        Semi-analytic European prices by the COS expansion of the Heston characteristic
+        function (no simulation or discretization bias)
+        K: strike or strike strip (last axis)
+        T: expiry or array of expiries (default the model's T); an (n_T,) array with an
+        (n_K,) strip gives an n_T x n_K grid
+        Returns: array of prices
+        """
+        T = self.T if T is None else T
+        return heston_price_cos(self.S0, K, T, self.r, self.v0, self.kappa, self.theta, self.sigma, self.rho,
+                                option_type=option_type, n_terms=n_terms)
+
+    def calibrate(self, strikes, expiries, market_vols, feller=True, **kwargs):
+        """
+        Fit v0, kappa, theta, sigma and rho to an implied vol surface with the COS pricer
+        (see Derivatives.heston_analytic.calibrate_heston), warm-started from the current
+        parameters (e.g. yesterday's fit), and store the result on the model
+        strikes, expiries, market_vols: one entry per quote
+        Returns: dict with the fitted parameters and the fit report (rmse, iterations, ...)
+        """
+        initial = [getattr(self, name) for name in HESTON_PARAMS]
+        fit = calibrate_heston(self.S0, strikes, expiries, market_vols, self.r, initial=initial, feller=feller,
+                               **kwargs)
+        for name in HESTON_PARAMS:
+            setattr(self, name, float(fit[name]))
+        return fit
+
+    def price_european_call_greeks(self, K, n_paths=10000, seed=None, sampler='pseudo', workers=None):
+        """
+        European call price and pathwise Greeks from one simulation (common random numbers):
+        delta (dS0), vega (d v0, the initial variance) and rho. The call payoff is Lipschitz,
+        so the pathwise derivatives 1{S_T > K} dS_T/dtheta are unbiased.
+        Returns: dict of 'price', 'delta', 'vega', 'rho' -> (estimate, standard error)
+        """
+        source = make_source(sampler, seed)
+        estimator = EstimatorSet(('price', 'delta', 'vega', 'rho'), n_replicates=source.n_replicates)
+        run_blocks(_call_greeks_block, n_paths, estimator, (self, K, source), workers)
+        df = np.exp(-self.r * self.T)
+        return {name: (df * mean, df * std_err) for name, (mean, std_err) in estimator.result().items()}
+
+
+def _call_block(block, n_block, model, K, source, scheme='euler', steps=None):
+    """
+    Undiscounted call payoffs at maturity for one path block.
+    """
+    if scheme == 'qe':
+        S_T, _ = model.simulate_qe(n_block, sampler=source, block=block, steps=steps)
+    else:
+        S_T = model.simulate_paths(n_block, sampler=source, block=block)[0][-1]
+    return np.maximum(S_T - K, 0), None
 
-        return price, std_err
+
+def _call_greeks_block(block, n_block, model, K, source):
+    """
+    Undiscounted call payoffs and their pathwise derivatives (rho including the -T discount term).
+    """
+    S_T, dS0, dv0, dr = model.simulate_terminal_tangents(n_block, sampler=source, block=block)
+    payoffs = np.maximum(S_T - K, 0)
+    itm = S_T > K
+    return {'price': payoffs, 'delta': itm * dS0, 'vega': itm * dv0, 'rho': itm * dr - model.T * payoffs}, None
 
 
 def plot_simulation(S, v, title="Heston Model Simulation"):
@@ -128,5 +312,30 @@ if __name__ == "__main__":
     print(f"European Call Option Price: {price:.4f}")
     print(f"Standard Error: {std_err:.4f}")
 
+    # Benchmark: one COS evaluation for a strike strip against Monte Carlo strike by strike
+    import time
+    strikes = np.array([80.0, 90.0, 100.0, 110.0, 120.0])
+    start = time.perf_counter()
+    cos_prices = heston.price_european_cos(strikes)
+    cos_time = time.perf_counter() - start
+    print(f"\nCOS, whole strip: {cos_time * 1e3:.2f} ms")
+    print(f"{'strike':>8}{'COS':>12}{'MC':>12}{'MC - COS':>12}{'std err':>10}{'MC time':>10}")
+    for K, cos_price in zip(strikes, cos_prices):
+        start = time.perf_counter()
+        mc_price, mc_err = heston.price_european_call(K, 100_000, seed=7)
+        mc_time = time.perf_counter() - start
+        print(f"{K:>8.1f}{cos_price:>12.5f}{mc_price:>12.5f}{mc_price - cos_price:>12.5f}{mc_err:>10.5f}"
+              f"{mc_time:>9.2f}s")
+
+    # Quadratic-Exponential scheme with monthly steps, terminal values only
+    print(f"\nQE, 12 monthly steps, terminal only (Euler holds 5 arrays of {steps + 1} steps, "
+          f"{5 * (steps + 1) * 8 / 1e3:.1f} GB per million paths; QE about ten path vectors, 0.08 GB)")
+    for K, cos_price in zip(strikes, cos_prices):
+        start = time.perf_counter()
+        mc_price, mc_err = heston.price_european_call(K, 100_000, seed=7, scheme='qe', steps=12)
+        mc_time = time.perf_counter() - start
+        print(f"{K:>8.1f}{cos_price:>12.5f}{mc_price:>12.5f}{mc_price - cos_price:>12.5f}{mc_err:>10.5f}"
+              f"{mc_time:>9.2f}s")
+
     # Plot sample paths
     plot_simulation(S, v)
\ No newline at end of file
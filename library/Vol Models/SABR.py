@@ -1,41 +1,13 @@
+import os
+import sys
+
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 
-
-# SABR model implementation using Hagan et al. approximation
-def sabr_implied_vol(f, k, t, alpha, beta, rho, nu):
-    """
-    Calculate SABR implied volatility.
-    Parameters:
-        f: Forward price (float)
-        k: Strike price (float)
-        t: Time to maturity (years, float)
-        alpha: Initial volatility level (float, >0)
-        beta: Elasticity of variance (float, 0<=beta<=1)
-        rho: Correlation between asset and vol (-1<=rho<=1)
-        nu: Volatility of volatility (float, >0)
-    Returns:
-        Implied volatility (float)
-    """
-    # ATM case (f == k)
-    if abs(f - k) < 1e-6:
-        term1 = alpha / (f ** (1 - beta))
-        term2 = 1 + ((1 - beta) ** 2 / 24) * (alpha ** 2 / (f ** (2 - 2 * beta)))
-        term3 = (rho * beta * nu * alpha) / (4 * f ** (1 - beta))
-        term4 = (2 - 3 * rho ** 2) * nu ** 2 / 24
-        return term1 * (1 + (term2 + term3 + term4) * t)
-
-    # Non-ATM case
-    z = (nu / alpha) * (f * k) ** ((1 - beta) / 2) * np.log(f / k)
-    x = np.log((np.sqrt(1 - 2 * rho * z + z ** 2) + z - rho) / (1 - rho))
-    numerator = alpha * (1 + ((1 - beta) ** 2 / 24) * np.log(f / k) ** 2 +
-                         ((1 - beta) ** 4 / 1920) * np.log(f / k) ** 4)
-    denominator = ((f * k) ** ((1 - beta) / 2)) * (
-            1 + ((1 - beta) ** 2 / 24) * (alpha ** 2 / ((f * k) ** (1 - beta))) +
-            (rho * beta * nu * alpha) / (4 * (f * k) ** ((1 - beta) / 2)) +
-            (2 - 3 * rho ** 2) * nu ** 2 / 24) * t
-    return (numerator / denominator) * (z / x) if x != 0 else np.nan
+# The vectorized SABR kernel lives in library/Derivatives
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.sabr import sabr_implied_vol
 
 
 # Plot volatility smile for varying parameters
@@ -45,13 +17,10 @@ def plot_sabr_smile(f=100, t=1.0, alpha=0.2, beta=0.5, rho=-0.5, nu=0.5):
     """
     strikes = np.linspace(50, 150, 100)  # Strike prices around forward (100)
 
-    # Base case
-    base_vols = [sabr_implied_vol(f, k, t, alpha, beta, rho, nu) for k in strikes]
-
-    # Tweaked parameters
-    alpha_vols = [sabr_implied_vol(f, k, t, alpha * 1.5, beta, rho, nu) for k in strikes]  # Increase alpha
-    rho_vols = [sabr_implied_vol(f, k, t, alpha, beta, 0.0, nu) for k in strikes]  # Zero rho
-    nu_vols = [sabr_implied_vol(f, k, t, alpha, beta, rho, nu * 1.5) for k in strikes]  # Increase nu
+    # Base case and tweaked parameters (higher alpha, zero rho, higher nu) in one call
+    base_vols, alpha_vols, rho_vols, nu_vols = sabr_implied_vol(
+        f, strikes, t, np.array([alpha, alpha * 1.5, alpha, alpha])[:, None], beta,
+        np.array([rho, rho, 0.0, rho])[:, None], np.array([nu, nu, nu, nu * 1.5])[:, None])
 
     plt.figure(figsize=(10, 6))
     plt.plot(strikes, base_vols, label=f'Base (α={alpha}, β={beta}, ρ={rho}, ν={nu})', linewidth=2)
@@ -83,8 +52,7 @@ def plot_sabr_surface(f=100, alpha=0.2, beta=0.5, rho=-0.5, nu=0.5):
     strikes = np.linspace(50, 150, 20)
     maturities = np.linspace(0.1, 2.0, 20)
     K, T = np.meshgrid(strikes, maturities)
-    vols = np.array([[sabr_implied_vol(f, k, t, alpha, beta, rho, nu)
-                      for k in strikes] for t in maturities])
+    vols = sabr_implied_vol(f, K, T, alpha, beta, rho, nu)
 
     fig = plt.figure(figsize=(10, 7))
     ax = fig.add_subplot(111, projection='3d')
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.Derivs import HierarchicalCorrelationGenerator
+from Derivatives.mc_engine import correlation_factor
+
+
+def test_hierarchical_factor_with_intra_below_inter():
+    # intra_cor < inter_cor makes the low-rank core indefinite although the matrix is positive definite
+    corr = HierarchicalCorrelationGenerator(10, 5, 0.1, 0.2).generate()
+    dense = corr.dense()
+    assert np.linalg.eigvalsh(dense).min() > 0
+    for factor in (corr.factor(), correlation_factor(corr)):
+        assert np.allclose(factor @ factor.T, dense, atol=1e-12)
+    samples = corr.sample(100_000, seed=1)
+    assert np.allclose(np.corrcoef(samples), dense, atol=0.02)
+
+
+def test_hierarchical_factor_rejects_indefinite_matrix():
+    with pytest.raises(ValueError):
+        HierarchicalCorrelationGenerator(10, 2, -0.5, 0.5).generate().factor()
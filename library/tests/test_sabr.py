@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Derivatives.sabr import sabr_implied_vol
+
+
+def test_atm_vol_pinned():
+    # Hagan et al. at the money: alpha / f^(1-beta) * (1 + (...) t); the pre-kernel SABR.py had
+    # an extra "1 +" in the time correction and gave 0.040248 here
+    f, t, alpha, beta, rho, nu = 100.0, 1.0, 0.2, 0.5, -0.5, 0.5
+    fb = f ** (1 - beta)
+    expected = alpha / fb * (1 + ((1 - beta) ** 2 / 24 * alpha ** 2 / fb ** 2 + rho * beta * nu * alpha / (4 * fb)
+                                  + (2 - 3 * rho ** 2) * nu ** 2 / 24) * t)
+    assert np.isclose(expected, 0.020248, rtol=0, atol=1e-12)
+    assert np.isclose(sabr_implied_vol(f, f, t, alpha, beta, rho, nu), 0.020248, rtol=0, atol=1e-12)
+
+
+def test_smile_continuous_through_the_forward():
+    f, t, alpha, beta, rho, nu = 100.0, 1.0, 0.2, 0.5, -0.5, 0.5
+    # both sides of the ATM series cutoff agree with the ATM value to the smile's slope
+    strikes = f * (1 + np.array([-1e-8, -1e-6, 1e-6, 1e-8]))
+    vols = sabr_implied_vol(f, strikes, t, alpha, beta, rho, nu)
+    atm = sabr_implied_vol(f, f, t, alpha, beta, rho, nu)
+    assert np.all(np.abs(vols - atm) < 2e-7 * np.abs(strikes / f - 1) / 1e-6)